@@ -1,29 +1,87 @@
 import os
-from flask import Flask, jsonify, redirect, url_for, request
+from flask import Flask, jsonify, redirect, url_for
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
 from app.config import config
 from app.extensions import jwt
+from app.json_provider import BSONJSONProvider
+
+# Also used by the CORS headers of the ASGI app (app/asgi.py)
+CORS_ORIGINS = ["http://localhost:3000"]
+
+def configure_caches(app):
+    """Size the in-process read caches from the app config"""
+    from app.models.course import catalog_cache, certificate_view_cache, certificate_miss_cache
+    from app.models.user import profile_cache
+
+    catalog_cache.configure(
+        maxsize=app.config['CATALOG_CACHE_MAX_ENTRIES'],
+        ttl=app.config['CATALOG_CACHE_TTL'],
+        stale_ttl=app.config['CATALOG_CACHE_STALE_TTL']
+    )
+    certificate_view_cache.configure(
+        maxsize=app.config['CERTIFICATE_VIEW_CACHE_MAX_ENTRIES'],
+        ttl=app.config['CERTIFICATE_VIEW_CACHE_TTL']
+    )
+    certificate_miss_cache.configure(
+        maxsize=app.config['CERTIFICATE_MISS_CACHE_MAX_ENTRIES'],
+        ttl=app.config['CERTIFICATE_MISS_CACHE_TTL']
+    )
+    profile_cache.configure(
+        maxsize=app.config['USER_CACHE_MAX_ENTRIES'],
+        ttl=app.config['USER_CACHE_TTL']
+    )
 
 def create_app(config_name=os.getenv('FLASK_ENV', 'default')):
     app = Flask(__name__)
+    app.json = BSONJSONProvider(app)
     
     # Configure CORS properly
     CORS(app, 
-         resources={r"/api/*": {"origins": ["http://localhost:3000"]}}, 
+         resources={r"/api/*": {"origins": CORS_ORIGINS}}, 
          supports_credentials=True,
-         allow_headers=["Content-Type", "Authorization"])
+         allow_headers=["Content-Type", "Authorization"],
+         expose_headers=["X-Next-Cursor", "ETag"])
     
-    @app.before_request
-    def log_request_info():
-        print(f"Received {request.method} request to {request.path}")
-        print(f"Headers: {dict(request.headers)}")
     app.config.from_object(config[config_name])
     
+    # after_request hooks run in reverse order; registering compression
+    # first makes it the last thing to touch the response body
+    from app import compression
+    compression.init_app(app)
+    
+    from app.request_logging import request_logger
+    request_logger.init_app(app)
+    
+    # Prometheus /metrics and CloudWatch aggregation
+    from app.monitoring import monitor
+    monitor.init_app(app)
+    
     # Initialize direct MongoDB connection
     from app import database
     database.init_app(app)
     
+    # Data clean-up commands that unblock the unique indexes
+    from app.models import migrations
+    migrations.init_app(app)
+
+    # Build the declared indexes and register the index CLI commands
+    from app.models import indexes
+    indexes.init_app(app)
+
+    # Registers the backfill-updated-at CLI command used by delta sync
+    from app.models import sync
+    sync.init_app(app)
+    
+    configure_caches(app)
+
+    from app import certificate_signing
+    certificate_signing.init_app(app)
+
+    # Password hashing runs in a bounded process pool
+    from app.passwords import password_hasher
+    password_hasher.init_app(app)
+
     jwt.init_app(app)
     
     # Register blueprints
@@ -31,11 +89,13 @@ def create_app(config_name=os.getenv('FLASK_ENV', 'default')):
     from app.routes.courses import courses_bp
     from app.routes.market import market_bp
     from app.routes.api_root import api_root_bp
+    from app.routes.sync import sync_bp
     
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
     app.register_blueprint(courses_bp, url_prefix='/api')
     app.register_blueprint(market_bp, url_prefix='/api/market')
     app.register_blueprint(api_root_bp, url_prefix='/api')
+    app.register_blueprint(sync_bp, url_prefix='/api')
     
     # Root route
     @app.route('/')
@@ -0,0 +1,61 @@
+"""
+ASGI application for the async read path.
+
+Serves the public market and course read endpoints with ``async def``
+views backed by pymongo's async driver. Independent lookups run
+concurrently, and a worker waiting on MongoDB or a slow client holds no
+thread, so one process can keep thousands of requests in flight. It runs
+alongside the WSGI app (app/serve.py) and answers the same URLs, so a
+reverse proxy can send these GET requests to it:
+
+    uvicorn app.asgi:app --workers 4 --port 5001
+
+Like app/serve.py it uses APP_CONFIG (default production), and it refuses
+to start on the development signing key, so certificate ids issued by the
+WSGI app verify here.
+
+Write endpoints, authentication and everything else stay on the WSGI app.
+"""
+
+from quart import Quart, request
+from app import CORS_ORIGINS, async_database, certificate_signing, configure_caches
+from app.config import config, server_config_name
+from app.json_provider import BSONJSONProvider
+
+def create_asgi_app(config_name=None):
+    app = Quart(__name__)
+    app.json = BSONJSONProvider(app)
+    # Same config rule as app/serve.py, so both tiers sign with one key
+    app.config.from_object(config[config_name or server_config_name()])
+
+    # after_request hooks run in reverse order, as on the WSGI app:
+    # compression is the last thing to touch the response body
+    from app import compression
+    compression.init_asgi_app(app)
+
+    from app.request_logging import request_logger
+    request_logger.init_asgi_app(app)
+
+    async_database.init_app(app)
+    certificate_signing.init_app(app)
+    certificate_signing.require_server_key(app)
+    # Same caches and sizes as the WSGI app
+    configure_caches(app)
+
+    from app.routes.async_api import async_api_bp
+    app.register_blueprint(async_api_bp, url_prefix='/api')
+
+    @app.after_request
+    async def add_cors_headers(response):
+        # Mirrors the flask-cors setup of the WSGI app for these read routes
+        origin = request.headers.get('Origin')
+        if origin in CORS_ORIGINS:
+            response.headers['Access-Control-Allow-Origin'] = origin
+            response.headers['Access-Control-Allow-Credentials'] = 'true'
+            response.headers['Access-Control-Expose-Headers'] = 'X-Next-Cursor, ETag'
+            response.vary.add('Origin')
+        return response
+
+    return app
+
+app = create_asgi_app()
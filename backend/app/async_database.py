@@ -0,0 +1,45 @@
+"""
+Async MongoDB access for the ASGI app (app/asgi.py).
+
+Each worker process owns one ``AsyncMongoClient``. It is opened on the
+server's event loop when the app starts serving and closed when it stops.
+Connection settings are the same MONGO_* settings the sync client uses.
+"""
+
+from pymongo import AsyncMongoClient
+from app import database
+
+_client = None
+_db = None
+
+async def connect():
+    """Open the worker's client and ping the server"""
+    global _client, _db
+
+    uri = database.mongo_uri()
+    _client = AsyncMongoClient(uri, **database.client_options(uri))
+    _db = _client.get_default_database(default=database.DEFAULT_DB_NAME)
+    await _client.admin.command('ping')
+
+async def close():
+    global _client, _db
+
+    client, _client, _db = _client, None, None
+    if client is not None:
+        await client.close()
+
+def get_async_db():
+    """
+    Returns the async database object for the current worker
+    """
+    if _db is None:
+        raise RuntimeError('Async MongoDB client is not connected')
+    return _db
+
+def init_app(app):
+    """
+    Connect when the ASGI app starts serving and disconnect on shutdown
+    """
+    database.configure(app)
+    app.before_serving(connect)
+    app.after_serving(close)
@@ -0,0 +1,167 @@
+"""
+Bounded in-process caches.
+
+``TTLCache`` is a thread-safe LRU with a freshness TTL and a longer stale
+window. Fresh hits are returned directly. Stale hits are returned at once
+while a single background thread reloads the key. If loading fails, the
+last good value is served instead of the error. A
+version counter invalidates every entry at once; loads that started before
+an invalidation are discarded instead of being stored.
+
+``get_or_load_async`` is the same lookup for the async views (app/asgi.py),
+with a coroutine loader and stale reloads run as tasks on the event loop.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+class _Entry:
+    __slots__ = ('value', 'version', 'fresh_until', 'stale_until')
+
+    def __init__(self, value, version, fresh_until, stale_until):
+        self.value = value
+        self.version = version
+        self.fresh_until = fresh_until
+        self.stale_until = stale_until
+
+class TTLCache:
+    def __init__(self, maxsize=256, ttl=60, stale_ttl=0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.version = 0
+        self._data = OrderedDict()
+        self._refreshing = set()
+        self._tasks = set()
+        self._lock = threading.Lock()
+
+    def configure(self, maxsize=None, ttl=None, stale_ttl=None):
+        """Apply settings from the app config and drop existing entries"""
+        with self._lock:
+            if maxsize is not None:
+                self.maxsize = maxsize
+            if ttl is not None:
+                self.ttl = ttl
+            if stale_ttl is not None:
+                self.stale_ttl = stale_ttl
+            self.version += 1
+            self._data.clear()
+
+    def invalidate(self):
+        """Bump the version so every cached entry is reloaded on next use"""
+        with self._lock:
+            self.version += 1
+            self._data.clear()
+
+    def pop(self, key):
+        """Drop a single key"""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def peek(self, key, default=None):
+        """The cached value for ``key`` while it is fresh, without loading"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or time.monotonic() >= entry.fresh_until:
+                return default
+            self._data.move_to_end(key)
+            return entry.value
+
+    def put(self, key, value):
+        """Store ``value`` for ``key``"""
+        self._store(key, value, self.version)
+
+    def _lookup(self, key):
+        """
+        ``(version, entry, servable, refresh)`` for ``key``. ``servable`` is True
+        when the entry is fresh or stale; ``refresh`` is True when the caller
+        should start the single background reload of a stale entry.
+        """
+        now = time.monotonic()
+        with self._lock:
+            version = self.version
+            entry = self._data.get(key)
+            if entry is None or now >= entry.stale_until:
+                return version, entry, False, False
+            self._data.move_to_end(key)
+            if now < entry.fresh_until or key in self._refreshing:
+                return version, entry, True, False
+            self._refreshing.add(key)
+            return version, entry, True, True
+
+    def get_or_load(self, key, loader):
+        """Return the cached value for ``key``, calling ``loader()`` on a miss"""
+        version, entry, servable, refresh = self._lookup(key)
+        if refresh:
+            threading.Thread(
+                target=self._refresh, args=(key, loader, version), daemon=True
+            ).start()
+        if servable:
+            return entry.value
+
+        try:
+            value = loader()
+        except Exception:
+            # Keep serving an expired value rather than failing outright
+            if entry is not None:
+                return entry.value
+            raise
+
+        self._store(key, value, version)
+        return value
+
+    async def get_or_load_async(self, key, loader):
+        """``get_or_load`` for a coroutine function ``loader``"""
+        version, entry, servable, refresh = self._lookup(key)
+        if refresh:
+            task = asyncio.get_running_loop().create_task(self._refresh_async(key, loader, version))
+            # The loop only keeps weak references to tasks
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        if servable:
+            return entry.value
+
+        try:
+            value = await loader()
+        except Exception:
+            if entry is not None:
+                return entry.value
+            raise
+
+        self._store(key, value, version)
+        return value
+
+    def _refresh(self, key, loader, version):
+        try:
+            self._store(key, loader(), version)
+        except Exception as e:
+            logger.warning(f"Background cache refresh failed for {key!r}: {str(e)}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    async def _refresh_async(self, key, loader, version):
+        try:
+            self._store(key, await loader(), version)
+        except Exception as e:
+            logger.warning(f"Background cache refresh failed for {key!r}: {str(e)}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def _store(self, key, value, version):
+        now = time.monotonic()
+        with self._lock:
+            if version != self.version:
+                return
+            self._data[key] = _Entry(
+                value, version, now + self.ttl, now + self.ttl + self.stale_ttl
+            )
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
@@ -0,0 +1,99 @@
+"""
+Self-verifying certificate ids and verification codes.
+
+Certificate ids carry a truncated HMAC of their random part, and the
+verification code is an HMAC of the id, both under
+CERTIFICATE_SIGNING_KEY. The public certificate endpoints check them in
+memory, so forged or mistyped values are rejected without touching the
+database. Ids issued before signing ("AGRO-" + 16 hex digits) are accepted
+while CERTIFICATE_ACCEPT_LEGACY_IDS is on.
+"""
+
+import base64
+import hashlib
+import hmac
+import re
+import secrets
+from app.config import DEV_CERTIFICATE_SIGNING_KEY
+
+CERTIFICATE_ID_PREFIX = 'AGRO-'
+
+_SIGNED_ID = re.compile(r'^AGRO-([0-9A-F]{16})-([0-9A-F]{8})$')
+_LEGACY_ID = re.compile(r'^AGRO-[0-9A-F]{16}$')
+
+_key = DEV_CERTIFICATE_SIGNING_KEY.encode('utf-8')
+_accept_legacy = True
+
+def _mac(purpose, message):
+    return hmac.new(_key, f"{purpose}:{message}".encode('utf-8'), hashlib.sha256).digest()
+
+def _id_tag(nonce):
+    return _mac('id', nonce)[:4].hex().upper()
+
+def new_certificate_id():
+    """Random certificate id with its signature appended"""
+    nonce = secrets.token_hex(8).upper()
+    return f"{CERTIFICATE_ID_PREFIX}{nonce}-{_id_tag(nonce)}"
+
+def is_legacy_certificate_id(certificate_id):
+    return bool(_LEGACY_ID.fullmatch(certificate_id or ''))
+
+def certificate_id_valid(certificate_id):
+    """False for ids this server cannot have issued"""
+    match = _SIGNED_ID.fullmatch(certificate_id or '')
+    if match:
+        return hmac.compare_digest(match.group(2).encode('ascii'), _id_tag(match.group(1)).encode('ascii'))
+    return _accept_legacy and is_legacy_certificate_id(certificate_id)
+
+def verification_code_for(certificate_id):
+    """Verification code printed on a signed certificate"""
+    digest = _mac('verify', certificate_id)[:16]
+    return base64.urlsafe_b64encode(digest).rstrip(b'=').decode('ascii')
+
+def codes_match(expected, supplied):
+    """Constant-time comparison that is False for anything but matching strings"""
+    if not isinstance(expected, str) or not isinstance(supplied, str):
+        return False
+    return hmac.compare_digest(expected.encode('utf-8'), supplied.encode('utf-8'))
+
+def verification_code_valid(certificate_id, verification_code):
+    """
+    In-memory check of a code against a signed id. Legacy ids have random
+    codes that can only be checked against the stored certificate, so any
+    string passes here for them.
+    """
+    if not isinstance(verification_code, str) or not certificate_id_valid(certificate_id):
+        return False
+    if is_legacy_certificate_id(certificate_id):
+        return True
+    return codes_match(verification_code_for(certificate_id), verification_code)
+
+def key_id():
+    """Short fingerprint of the signing key, safe to log and compare"""
+    return _mac('key-id', '').hex()[:12]
+
+def require_server_key(app):
+    """
+    Checks for the production servers. The WSGI app issues ids that the
+    ASGI app must verify, so neither may run on the development key, and
+    both must match CERTIFICATE_SIGNING_KEY_ID when it is set.
+    """
+    if _key == DEV_CERTIFICATE_SIGNING_KEY.encode('utf-8'):
+        raise RuntimeError('Set CERTIFICATE_SIGNING_KEY (or SECRET_KEY) before starting a server')
+    expected = app.config.get('CERTIFICATE_SIGNING_KEY_ID')
+    if expected and expected != key_id():
+        raise RuntimeError(
+            f"Certificate signing key id is {key_id()}, expected {expected}; "
+            "the WSGI and ASGI servers must share one key"
+        )
+    app.logger.info(f"Certificate signing key id {key_id()}")
+
+def init_app(app):
+    """Load the signing key and legacy-id policy from the app config"""
+    global _key, _accept_legacy
+
+    key = app.config.get('CERTIFICATE_SIGNING_KEY')
+    if not key:
+        raise RuntimeError('CERTIFICATE_SIGNING_KEY is not set')
+    _key = key.encode('utf-8')
+    _accept_legacy = app.config.get('CERTIFICATE_ACCEPT_LEGACY_IDS', True)
@@ -0,0 +1,122 @@
+"""
+Negotiated response compression.
+
+Large JSON responses are brotli- or gzip-encoded according to the client's
+Accept-Encoding. Responses that carry a strong ETag (see app/http_cache.py)
+have their compressed bodies kept in a small LRU keyed by ETag and
+encoding, so hot catalog and certificate payloads are compressed once per
+version rather than on every hit. The cache saves compression only: by the
+time this hook runs the view has already built and serialized the body.
+Views avoid that work on unchanged data by answering 304 to a matching
+If-None-Match before serializing (see app/http_cache.py).
+"""
+
+import gzip
+from flask import current_app, request
+from app.cache import TTLCache
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = {
+    'application/json',
+    'application/javascript',
+    'text/html',
+    'text/plain',
+    'text/css',
+}
+
+# Compressed bodies (None when below the size threshold) keyed by
+# (etag, encoding, level, min_size)
+precompressed_cache = TTLCache(maxsize=256, ttl=3600)
+
+def available_encodings():
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+def compress(data, encoding, level):
+    if encoding == 'br':
+        return brotli.compress(data, quality=level)
+    # mtime=0 keeps the output identical for identical input
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+def negotiate_encoding(response, config, accept_encodings):
+    """
+    Encoding to apply to a buffered response, or None. Adds the Vary header
+    to every response the outcome depends on.
+    """
+    if not config.get('COMPRESS_ENABLED', True):
+        return None
+
+    if (response.status_code < 200 or response.status_code in (204, 304)
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return None
+
+    response.vary.add('Accept-Encoding')
+    return accept_encodings.best_match(available_encodings())
+
+def encode_response(response, encoding, config, read_body):
+    """Replace the body with its encoded form; ``read_body()`` returns the bytes"""
+    min_size = config.get('COMPRESS_MIN_SIZE', 500)
+    level = config.get('COMPRESS_BR_LEVEL', 4) if encoding == 'br' else config.get('COMPRESS_LEVEL', 6)
+
+    def compress_body():
+        # None for bodies too small to be worth encoding
+        data = read_body()
+        return compress(data, encoding, level) if len(data) >= min_size else None
+
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        # A hit skips reading and compressing the body
+        body = precompressed_cache.get_or_load((etag, encoding, level, min_size), compress_body)
+    else:
+        body = compress_body()
+    if body is None:
+        return
+
+    if etag and not weak:
+        # The encoded bytes differ from the identity representation, so the
+        # validator is downgraded to weak (If-None-Match still matches it)
+        response.set_etag(etag, weak=True)
+    response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+
+def compress_response(response):
+    """after_request hook that encodes eligible responses"""
+    if response.direct_passthrough or response.is_streamed:
+        return response
+
+    encoding = negotiate_encoding(response, current_app.config, request.accept_encodings)
+    if encoding is not None:
+        encode_response(response, encoding, current_app.config, response.get_data)
+    return response
+
+def init_app(app):
+    """
+    Register the compression hook
+    """
+    precompressed_cache.configure(maxsize=app.config.get('COMPRESS_CACHE_ENTRIES', 256))
+    app.after_request(compress_response)
+
+def init_asgi_app(app):
+    """
+    Register the same compression, sharing precompressed_cache, on the
+    Quart app (app/asgi.py)
+    """
+    from quart import request as async_request
+    from quart.wrappers.response import DataBody
+
+    precompressed_cache.configure(maxsize=app.config.get('COMPRESS_CACHE_ENTRIES', 256))
+
+    @app.after_request
+    async def compress_async_response(response):
+        # Only in-memory bodies; streamed and file bodies go out as they are
+        if not isinstance(response.response, DataBody):
+            return response
+
+        encoding = negotiate_encoding(response, app.config, async_request.accept_encodings)
+        if encoding is not None:
+            encode_response(response, encoding, app.config, lambda: response.response.data)
+        return response
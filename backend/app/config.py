@@ -3,16 +3,116 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+# Signing key used when none is configured. Fine for run.py; the
+# production servers refuse to start with it.
+DEV_CERTIFICATE_SIGNING_KEY = 'dev-certificate-key-dagri-talk'
+
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key-dagri-talk'
     MONGO_URI = os.environ.get('MONGO_URI') or 'mongodb://localhost:27017/dagri_talk'
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY') or 'jwt-secret-dagri-talk'
 
+    # MongoDB connection pool (one shared client per worker process)
+    MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', 100))
+    MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', 0))
+    MONGO_MAX_IDLE_TIME_MS = int(os.environ.get('MONGO_MAX_IDLE_TIME_MS', 300000))
+    MONGO_CONNECT_TIMEOUT_MS = int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', 5000))
+    MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', 5000))
+    MONGO_SOCKET_TIMEOUT_MS = int(os.environ.get('MONGO_SOCKET_TIMEOUT_MS', 30000))
+    MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', 2000))
+    # Open the pool and ping the server while the app is created
+    MONGO_WARM_UP = os.environ.get('MONGO_WARM_UP', 'true').lower() == 'true'
+    # Apply the index registry in app/models/indexes.py at start-up
+    MONGO_ENSURE_INDEXES = os.environ.get('MONGO_ENSURE_INDEXES', 'true').lower() == 'true'
+
+    # Keyset pagination for the course catalog and market feed; requests
+    # without limit/after still get the full list
+    PAGE_SIZE_DEFAULT = int(os.environ.get('PAGE_SIZE_DEFAULT', 50))
+    PAGE_SIZE_MAX = int(os.environ.get('PAGE_SIZE_MAX', 200))
+
+    # In-process course catalog cache (seconds)
+    CATALOG_CACHE_TTL = int(os.environ.get('CATALOG_CACHE_TTL', 60))
+    CATALOG_CACHE_STALE_TTL = int(os.environ.get('CATALOG_CACHE_STALE_TTL', 600))
+    CATALOG_CACHE_MAX_ENTRIES = int(os.environ.get('CATALOG_CACHE_MAX_ENTRIES', 512))
+
+    # Most module completions accepted by POST /api/enrollments/progress/batch
+    PROGRESS_BATCH_MAX_ITEMS = int(os.environ.get('PROGRESS_BATCH_MAX_ITEMS', 500))
+
+    # Delta sync (/api/sync): most changes returned per collection per call,
+    # and how far before "now" the returned watermark is set (seconds)
+    SYNC_MAX_ITEMS = int(os.environ.get('SYNC_MAX_ITEMS', 1000))
+    SYNC_CLOCK_SKEW_SECONDS = int(os.environ.get('SYNC_CLOCK_SKEW_SECONDS', 5))
+
+    # In-process user profile cache (seconds). Profile writes invalidate the
+    # entry in the writing process; other workers pick changes up within the TTL.
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 60))
+    USER_CACHE_MAX_ENTRIES = int(os.environ.get('USER_CACHE_MAX_ENTRIES', 10000))
+
+    # Browser/proxy cache lifetime for issued certificates (seconds)
+    CERTIFICATE_CACHE_MAX_AGE = int(os.environ.get('CERTIFICATE_CACHE_MAX_AGE', 86400))
+
+    # Certificate ids and verification codes are HMAC-signed with this key
+    # (app/certificate_signing.py). Changing it invalidates issued codes.
+    CERTIFICATE_SIGNING_KEY = os.environ.get('CERTIFICATE_SIGNING_KEY') or DEV_CERTIFICATE_SIGNING_KEY
+    # Optional fingerprint of the key (logged at start-up). When set, the
+    # WSGI and ASGI servers refuse to start with any other key.
+    CERTIFICATE_SIGNING_KEY_ID = os.environ.get('CERTIFICATE_SIGNING_KEY_ID')
+    # Accept unsigned ids issued before signing was introduced. Any
+    # well-formed legacy id costs a database read, so turn this off once
+    # every certificate has been reissued with a signed id.
+    CERTIFICATE_ACCEPT_LEGACY_IDS = os.environ.get('CERTIFICATE_ACCEPT_LEGACY_IDS', 'true').lower() == 'true'
+    # In-process cache of public certificate views (seconds)
+    CERTIFICATE_VIEW_CACHE_TTL = int(os.environ.get('CERTIFICATE_VIEW_CACHE_TTL', 3600))
+    CERTIFICATE_VIEW_CACHE_MAX_ENTRIES = int(os.environ.get('CERTIFICATE_VIEW_CACHE_MAX_ENTRIES', 10000))
+    # Ids with no certificate are remembered separately, briefly (seconds)
+    CERTIFICATE_MISS_CACHE_TTL = int(os.environ.get('CERTIFICATE_MISS_CACHE_TTL', 30))
+    CERTIFICATE_MISS_CACHE_MAX_ENTRIES = int(os.environ.get('CERTIFICATE_MISS_CACHE_MAX_ENTRIES', 1000))
+
+    # Response compression (gzip always, brotli when installed)
+    COMPRESS_ENABLED = os.environ.get('COMPRESS_ENABLED', 'true').lower() == 'true'
+    COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 500))
+    COMPRESS_LEVEL = int(os.environ.get('COMPRESS_LEVEL', 6))
+    COMPRESS_BR_LEVEL = int(os.environ.get('COMPRESS_BR_LEVEL', 4))
+    COMPRESS_CACHE_ENTRIES = int(os.environ.get('COMPRESS_CACHE_ENTRIES', 256))
+
+    # Request logging: records are queued and written by a background thread.
+    # Sample rates are fractions per status class ("2xx=0.1,5xx=1") and per
+    # endpoint ("health_check=0.01").
+    REQUEST_LOG_ENABLED = os.environ.get('REQUEST_LOG_ENABLED', 'true').lower() == 'true'
+    REQUEST_LOG_QUEUE_SIZE = int(os.environ.get('REQUEST_LOG_QUEUE_SIZE', 10000))
+    REQUEST_LOG_SAMPLE_RATES = os.environ.get('REQUEST_LOG_SAMPLE_RATES', '')
+    REQUEST_LOG_ROUTE_SAMPLE_RATES = os.environ.get('REQUEST_LOG_ROUTE_SAMPLE_RATES', '')
+    REQUEST_LOG_HEADERS = os.environ.get('REQUEST_LOG_HEADERS', 'false').lower() == 'true'
+
+    # CloudWatch metrics (app/monitoring.py): aggregated in process and
+    # flushed every CLOUDWATCH_FLUSH_INTERVAL seconds. CLOUDWATCH_SINK=stub
+    # keeps them in memory instead of calling AWS.
+    CLOUDWATCH_SINK = os.environ.get('CLOUDWATCH_SINK', 'cloudwatch')
+    CLOUDWATCH_REGION = os.environ.get('CLOUDWATCH_REGION', 'us-east-1')
+    CLOUDWATCH_NAMESPACE = os.environ.get('CLOUDWATCH_NAMESPACE', 'DAgriTalk/Application')
+    CLOUDWATCH_FLUSH_INTERVAL = int(os.environ.get('CLOUDWATCH_FLUSH_INTERVAL', 60))
+    CLOUDWATCH_MAX_SERIES = int(os.environ.get('CLOUDWATCH_MAX_SERIES', 1000))
+    CLOUDWATCH_HIGH_RESOLUTION = os.environ.get('CLOUDWATCH_HIGH_RESOLUTION', 'false').lower() == 'true'
+    # How long /metrics reuses collection document counts (seconds)
+    METRICS_COUNT_CACHE_TTL = int(os.environ.get('METRICS_COUNT_CACHE_TTL', 60))
+
+    # Password hashing (app/passwords.py). The method is a werkzeug method
+    # string with its work factor, e.g. "scrypt:32768:8:1" or
+    # "pbkdf2:sha256:1000000"; stored hashes made with anything else are
+    # upgraded on the next successful login. PASSWORD_HASH_WORKERS=0 hashes
+    # inline instead of in the process pool.
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt')
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+    PASSWORD_HASH_MAX_PENDING = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', 32))
+    PASSWORD_HASH_TIMEOUT = int(os.environ.get('PASSWORD_HASH_TIMEOUT', 10))
+
 class DevelopmentConfig(Config):
     DEBUG = True
+    CLOUDWATCH_SINK = os.environ.get('CLOUDWATCH_SINK', 'stub')
 
 class TestingConfig(Config):
     TESTING = True
+    CLOUDWATCH_SINK = os.environ.get('CLOUDWATCH_SINK', 'stub')
     # Use a separate database for testing
     MONGO_URI = os.environ.get('MONGO_URI_TEST') or 'mongodb://localhost:27017/dagri_talk_test'
 
@@ -22,6 +122,7 @@ class ProductionConfig(Config):
     # In production, no default fallback for security keys
     SECRET_KEY = os.environ.get('SECRET_KEY')
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY')
+    CERTIFICATE_SIGNING_KEY = os.environ.get('CERTIFICATE_SIGNING_KEY') or SECRET_KEY
     MONGO_URI = os.environ.get('MONGO_URI')
 
 config = {
@@ -29,4 +130,11 @@ config = {
     'testing': TestingConfig,
     'production': ProductionConfig,
     'default': DevelopmentConfig
-}
\ No newline at end of file
+}
+
+def server_config_name():
+    """
+    Config for the production servers (app/serve.py, app/asgi.py). Not
+    FLASK_ENV: backend/.env sets that to development for run.py.
+    """
+    return os.environ.get('APP_CONFIG', 'production')
\ No newline at end of file
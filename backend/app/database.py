@@ -1,57 +1,129 @@
 import pymongo
 import certifi
 import os
-from flask import g
+import threading
+
+DEFAULT_DB_NAME = "dagri_talk"
+
+# One MongoClient per worker process. pymongo clients own their own
+# connection pool and monitor threads, so they are shared across requests
+# and threads but must never be carried across a fork.
+_client = None
+_client_pid = None
+_db = None
+_client_lock = threading.Lock()
+_settings = {}
+
+def client_options(mongo_uri):
+    """
+    Builds MongoClient keyword arguments from the configured pool settings
+    """
+    # Determine if we need SSL based on the URI or environment
+    use_ssl = 'ssl=true' in mongo_uri.lower() if mongo_uri else False
+
+    client_options = {
+        'maxPoolSize': _settings.get('MONGO_MAX_POOL_SIZE', 100),
+        'minPoolSize': _settings.get('MONGO_MIN_POOL_SIZE', 0),
+        'maxIdleTimeMS': _settings.get('MONGO_MAX_IDLE_TIME_MS'),
+        'connectTimeoutMS': _settings.get('MONGO_CONNECT_TIMEOUT_MS', 5000),
+        'serverSelectionTimeoutMS': _settings.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', 5000),
+        'socketTimeoutMS': _settings.get('MONGO_SOCKET_TIMEOUT_MS'),
+        'waitQueueTimeoutMS': _settings.get('MONGO_WAIT_QUEUE_TIMEOUT_MS'),
+        'retryWrites': True,
+    }
+    if use_ssl:
+        client_options['tlsCAFile'] = certifi.where()
+
+    return {key: value for key, value in client_options.items() if value is not None}
+
+def mongo_uri():
+    return _settings.get('MONGO_URI') or os.environ.get('MONGO_URI')
 
 def get_db_client():
     """
-    Returns a MongoDB client, reusing existing connection if available
-    """
-    if 'mongo_client' not in g:
-        mongo_uri = os.environ.get('MONGO_URI')
-        
-        # Determine if we need SSL based on the URI or environment
-        use_ssl = 'ssl=true' in mongo_uri.lower() if mongo_uri else False
-        
-        # Configure client options based on SSL requirement
-        client_options = {}
-        if use_ssl:
-            client_options['tlsCAFile'] = certifi.where()
-        
-        g.mongo_client = pymongo.MongoClient(mongo_uri, **client_options)
-    return g.mongo_client
+    Returns the process-wide MongoDB client, creating it on first use
+    """
+    global _client, _client_pid, _db
+
+    pid = os.getpid()
+    if _client is not None and _client_pid == pid:
+        return _client
+
+    with _client_lock:
+        if _client is None or _client_pid != pid:
+            uri = mongo_uri()
+            client = pymongo.MongoClient(uri, **client_options(uri))
+
+            # Extract database name from URI or use default
+            _db = client.get_default_database(default=DEFAULT_DB_NAME)
+            _client = client
+            _client_pid = pid
+    return _client
 
 def get_db():
     """
-    Returns the database object, extracting DB name from the URI
+    Returns the database object for the shared client. This is cheap
+    enough to call from every request and works outside an app context.
+    """
+    if _client is None or _client_pid != os.getpid():
+        get_db_client()
+    return _db
+
+def reset_client():
+    """
+    Drops the current client so the next call builds a fresh pool.
+
+    Call this in a child process after fork; the parent's sockets and
+    monitor threads are not usable there.
+    """
+    global _client, _client_pid, _db
+
+    with _client_lock:
+        client, pid = _client, _client_pid
+        _client = _client_pid = _db = None
+
+    # Only the process that opened the client may close its sockets
+    if client is not None and pid == os.getpid():
+        client.close()
+
+def _forget_client_after_fork():
+    global _client, _client_pid, _db, _client_lock
+    _client = _client_pid = _db = None
+    _client_lock = threading.Lock()
+
+def warm_up():
+    """
+    Opens the pool and runs a ping so the first request does not pay for
+    server discovery
     """
     client = get_db_client()
-    
-    # Extract database name from URI or use default
-    mongo_uri = os.environ.get('MONGO_URI')
-    db_name = "dagri_talk"  # default name
-    
-    # Try to extract database name from URI
-    if mongo_uri and '/' in mongo_uri:
-        parts = mongo_uri.split('/')
-        if len(parts) >= 4:
-            potential_db = parts[3].split('?')[0]
-            if potential_db:
-                db_name = potential_db
-    
-    return client[db_name]
-
-def close_db(e=None):
-    """
-    Close the MongoDB connection when the request is finished
-    """
-    mongo_client = g.pop('mongo_client', None)
-    
-    if mongo_client is not None:
-        mongo_client.close()
+    client.admin.command('ping')
+
+def configure(app):
+    """
+    Read the MONGO_* connection settings from the app config
+    """
+    _settings.clear()
+    _settings.update({
+        key: value for key, value in app.config.items() if key.startswith('MONGO_')
+    })
+    if not _settings.get('MONGO_URI'):
+        _settings.pop('MONGO_URI', None)
 
 def init_app(app):
     """
-    Register database functions with the Flask app
+    Configure the shared MongoDB client from the Flask app config
     """
-    app.teardown_appcontext(close_db)
\ No newline at end of file
+    configure(app)
+
+    # Settings may have changed (tests, app factory called twice)
+    reset_client()
+
+    if app.config.get('MONGO_WARM_UP', True):
+        try:
+            warm_up()
+        except pymongo.errors.PyMongoError as e:
+            app.logger.warning(f"MongoDB warm-up failed: {str(e)}")
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_forget_client_after_fork)
@@ -0,0 +1,31 @@
+"""
+HTTP conditional-request helpers.
+
+ETags are derived from what identifies a version of a resource (ids,
+``updated_at`` timestamps, issue dates), never from the serialized body, so
+a matching ``If-None-Match`` can be answered with a 304 before the response
+is built.
+"""
+
+import hashlib
+from flask import request
+from werkzeug.http import quote_etag
+
+def make_etag(*parts):
+    """Strong ETag value for the given version parts"""
+    digest = hashlib.sha1(repr(parts).encode('utf-8'))
+    return digest.hexdigest()
+
+def cache_headers(etag, cache_control='no-cache'):
+    """ETag and Cache-Control headers for a response"""
+    return {'ETag': quote_etag(etag), 'Cache-Control': cache_control}
+
+def not_modified(etag, if_none_match=None):
+    """True when the client's If-None-Match already has this version"""
+    if if_none_match is None:
+        if_none_match = request.if_none_match
+    return if_none_match.contains_weak(etag)
+
+def not_modified_response(etag, cache_control='no-cache'):
+    """Empty 304 carrying the validators the client should keep"""
+    return '', 304, cache_headers(etag, cache_control)
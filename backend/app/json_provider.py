@@ -0,0 +1,59 @@
+"""
+JSON provider that understands BSON types.
+
+Route handlers can hand MongoDB documents straight to ``jsonify``: ObjectId
+becomes its hex string, datetimes become ISO 8601 strings and Decimal128 /
+Decimal become decimal strings. When orjson is installed, the whole document
+is encoded in one native pass; otherwise the standard library encoder is
+used with the same conversions.
+"""
+
+import decimal
+import json
+from datetime import date, datetime
+from bson import Decimal128, ObjectId
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the stdlib encoder
+    orjson = None
+
+def bson_default(obj):
+    """Convert the BSON and stdlib types JSON does not know about"""
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, Decimal128):
+        return str(obj.to_decimal())
+    if isinstance(obj, decimal.Decimal):
+        return str(obj)
+    return DefaultJSONProvider.default(obj)
+
+class BSONJSONProvider(DefaultJSONProvider):
+    default = staticmethod(bson_default)
+
+    def dumps(self, obj, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.dumps(obj, default=bson_default).decode('utf-8')
+        kwargs.setdefault('default', self.default)
+        kwargs.setdefault('ensure_ascii', self.ensure_ascii)
+        kwargs.setdefault('sort_keys', self.sort_keys)
+        return json.dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return json.loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+
+        obj = self._prepare_response_obj(args, kwargs)
+        option = 0
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            option = orjson.OPT_INDENT_2
+        body = orjson.dumps(obj, default=bson_default, option=option | orjson.OPT_APPEND_NEWLINE)
+        return self._app.response_class(body, mimetype=self.mimetype)
@@ -1,7 +1,15 @@
+import asyncio
 from flask import current_app
 from bson import ObjectId
 from datetime import datetime
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError, BulkWriteError
+from app.async_database import get_async_db
+from app.cache import TTLCache
 from app.database import get_db
+from app.certificate_signing import new_certificate_id, verification_code_for
+from app.models.user import get_user_profile, get_user_profile_async
+from app.pagination import PAGE_SORT, keyset_query
 
 def get_courses_collection():
     return get_db().courses
@@ -12,6 +20,120 @@ def get_enrollments_collection():
 def get_certificates_collection():
     return get_db().certificates
 
+# Catalog listing view: course metadata and a module count, without the
+# module bodies. Computed server-side so the HTML never leaves the database.
+COURSE_OUTLINE_PROJECTION = {
+    "title": 1,
+    "description": 1,
+    "category": 1,
+    "level": 1,
+    "language": 1,
+    "duration_hours": 1,
+    "instructor_id": 1,
+    "is_published": 1,
+    "created_at": 1,
+    "updated_at": 1,
+    "module_count": {"$size": {"$ifNull": ["$modules", []]}}
+}
+
+COURSE_VIEWS = ('outline', 'full')
+
+# The catalog changes a few times a week; reads are served from memory.
+# Writes through Course bump the cache version; writes made elsewhere
+# (e.g. populate_courses.py) show up once the TTL runs out.
+catalog_cache = TTLCache(maxsize=512, ttl=60, stale_ttl=600)
+
+# Public certificate views never change once issued, so they are cached
+# for long periods and the public endpoints rarely reach the database
+certificate_view_cache = TTLCache(maxsize=10000, ttl=3600)
+
+# Ids that matched no certificate, kept briefly and apart from the views:
+# a stream of made-up ids (any "AGRO-" + 16 hex digits passes the in-memory
+# check while legacy ids are accepted) cannot evict real views
+certificate_miss_cache = TTLCache(maxsize=1000, ttl=30)
+
+class _CertificateMissing(Exception):
+    """Raised by certificate view loaders so misses are not cached as views"""
+
+def invalidate_catalog():
+    catalog_cache.invalidate()
+
+def catalog_query(filters):
+    """Catalog filter for published courses matching category/level/language"""
+    query = {"is_published": True}
+    for field in ('category', 'level', 'language'):
+        if filters.get(field):
+            query[field] = filters[field]
+    return query
+
+def build_certificate_view(certificate, course, enrollment, user):
+    """Public certificate representation served by /certificates/<id>"""
+    enrollment = enrollment or {}
+    return {
+        "certificate_id": certificate['certificate_id'],
+        "course_title": course['title'],
+        "course_category": course['category'],
+        "course_level": course['level'],
+        "course_duration": course['duration_hours'],
+        "student_name": f"{user.get('first_name', '')} {user.get('last_name', '')}".strip(),
+        "student_email": user.get('email', ''),
+        "issue_date": certificate['issue_date'],
+        "completion_date": enrollment.get('completed_at') or certificate['issue_date'],
+        "verification_code": certificate['verification_code'],
+        "modules_completed": len(enrollment.get('progress', [])),
+        "total_modules": len(course.get('modules', []))
+    }
+
+ENROLLMENT_PROGRESS_PROJECTION = {
+    "completed_modules": 1,
+    "total_modules": 1,
+    "progress_percentage": 1
+}
+
+def progress_update_pipeline(module_number, quiz_score=None):
+    """
+    Update pipeline that adds a module to an enrollment's progress once and
+    recomputes completed_modules and progress_percentage in the same write.
+    Progress keeps one entry per module number.
+    """
+    now = datetime.utcnow()
+    entry = {
+        "module_number": module_number,
+        "completed_at": now,
+        "quiz_score": quiz_score
+    }
+    progress = {"$ifNull": ["$progress", []]}
+    is_new_module = {"$and": [
+        {"$not": [{"$in": [{"$literal": module_number}, {"$map": {"input": progress, "in": "$$this.module_number"}}]}]},
+        # Enrollments without total_modules predate the counters; accept any module
+        {"$or": [
+            {"$eq": [{"$type": "$total_modules"}, "missing"]},
+            {"$lte": [{"$literal": module_number}, "$total_modules"]}
+        ]}
+    ]}
+    completed = {"$size": "$progress"}
+    return [
+        {"$set": {
+            "progress": {"$cond": [
+                is_new_module,
+                {"$concatArrays": [progress, [{"$literal": entry}]]},
+                progress
+            ]},
+            # Repeats change nothing, so they do not show up in delta sync
+            "updated_at": {"$cond": [is_new_module, {"$literal": now}, "$updated_at"]}
+        }},
+        {"$set": {
+            "completed_modules": completed,
+            "progress_percentage": {"$cond": [
+                {"$gt": [{"$ifNull": ["$total_modules", 0]}, 0]},
+                {"$round": [{"$multiply": [
+                    {"$divide": [{"$min": [completed, "$total_modules"]}, "$total_modules"]}, 100
+                ]}, 2]},
+                0
+            ]}
+        }}
+    ]
+
 class Course:
     @staticmethod
     def create_course(course_data):
@@ -19,38 +141,110 @@ class Course:
         course_data['created_at'] = datetime.utcnow()
         course_data['updated_at'] = datetime.utcnow()
         result = courses.insert_one(course_data)
+        invalidate_catalog()
         return str(result.inserted_id)
 
     @staticmethod
-    def get_all_courses(filters=None):
-        courses = get_courses_collection()
-        query = {"is_published": True}
-        
-        if filters:
-            if filters.get('category'):
-                query['category'] = filters['category']
-            if filters.get('level'):
-                query['level'] = filters['level']
-            if filters.get('language'):
-                query['language'] = filters['language']
-                
-        return list(courses.find(query))
+    def get_all_courses(filters=None, limit=None, after=None, view='full'):
+        """
+        Published courses, newest first. ``limit`` and ``after`` (a decoded
+        cursor key) select a keyset page; without them every match is returned.
+        ``view='outline'`` leaves out the module bodies.
+        """
+        filters = filters or {}
+        docs = catalog_cache.get_or_load(
+            Course._catalog_key(filters, limit, after, view),
+            lambda: list(Course._find_courses(get_courses_collection(), filters, limit, after, view))
+        )
+        # Callers get their own top-level dicts so they cannot alter the cache
+        return [dict(doc) for doc in docs]
+
+    @staticmethod
+    async def get_all_courses_async(filters=None, limit=None, after=None, view='full'):
+        """``get_all_courses`` for the async views, sharing its cache entries"""
+        filters = filters or {}
+
+        async def load():
+            return await Course._find_courses(get_async_db().courses, filters, limit, after, view).to_list()
+
+        docs = await catalog_cache.get_or_load_async(Course._catalog_key(filters, limit, after, view), load)
+        return [dict(doc) for doc in docs]
+
+    @staticmethod
+    def _catalog_key(filters, limit, after, view):
+        return (
+            'list', filters.get('category'), filters.get('level'),
+            filters.get('language'), limit, after, view
+        )
+
+    @staticmethod
+    def _find_courses(courses, filters, limit, after, view):
+        """Catalog cursor on a sync or async courses collection"""
+        query = catalog_query(filters)
+        projection = COURSE_OUTLINE_PROJECTION if view == 'outline' else None
+        cursor = courses.find(keyset_query(query, after), projection).sort(PAGE_SORT)
+        if limit:
+            cursor = cursor.limit(limit)
+        return cursor
 
     @staticmethod
     def get_course_by_id(course_id):
-        courses = get_courses_collection()
-        return courses.find_one({"_id": ObjectId(course_id)})
+        course_id = ObjectId(course_id)
+        course = catalog_cache.get_or_load(
+            ('course', course_id),
+            lambda: get_courses_collection().find_one({"_id": course_id})
+        )
+        return dict(course) if course else None
+
+    @staticmethod
+    async def get_course_by_id_async(course_id):
+        """``get_course_by_id`` for the async views, sharing its cache entries"""
+        course_id = ObjectId(course_id)
+
+        async def load():
+            return await get_async_db().courses.find_one({"_id": course_id})
+
+        course = await catalog_cache.get_or_load_async(('course', course_id), load)
+        return dict(course) if course else None
 
 class Enrollment:
     @staticmethod
-    def create_enrollment(enrollment_data):
+    def create_enrollment(enrollment_data, course):
+        """
+        Enroll a user in a course, once. Returns ``(enrollment_id, created)``;
+        repeat calls return the existing enrollment.
+
+        An upsert against the unique (user_id, course_id) index. The _id is
+        generated here, so a returned document with that _id was inserted by
+        this call.
+        """
         enrollments = get_enrollments_collection()
+        enrollment_id = ObjectId()
+        enrollment_data['_id'] = enrollment_id
         enrollment_data['enrolled_at'] = datetime.utcnow()
+        enrollment_data['updated_at'] = enrollment_data['enrolled_at']
         enrollment_data['progress'] = []
         enrollment_data['completed_at'] = None
         enrollment_data['certificate_issued'] = False
-        result = enrollments.insert_one(enrollment_data)
-        return str(result.inserted_id)
+        # Stored so progress and completion checks never need the course
+        enrollment_data['course_title'] = course['title']
+        enrollment_data['total_modules'] = len(course.get('modules', []))
+        enrollment_data['completed_modules'] = 0
+        enrollment_data['progress_percentage'] = 0
+
+        query = {"user_id": enrollment_data['user_id'], "course_id": enrollment_data['course_id']}
+        try:
+            enrollment = enrollments.find_one_and_update(
+                query,
+                {"$setOnInsert": enrollment_data},
+                upsert=True,
+                projection={"_id": 1},
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # A concurrent request inserted it first
+            enrollment = enrollments.find_one(query, {"_id": 1})
+        return str(enrollment['_id']), enrollment['_id'] == enrollment_id
 
     @staticmethod
     def get_user_enrollments(user_id):
@@ -58,13 +252,148 @@ class Enrollment:
         return list(enrollments.find({"user_id": ObjectId(user_id)}))
 
     @staticmethod
-    def update_progress(enrollment_id, module_data):
+    def get_user_courses(user_id):
+        """
+        A user's enrollments joined with the course title and module count,
+        in a single aggregation and already in the /my-courses response
+        shape. Enrollments whose course is gone are dropped.
+        """
         enrollments = get_enrollments_collection()
-        enrollments.update_one(
-            {"_id": ObjectId(enrollment_id)},
-            {"$push": {"progress": module_data}}
+        pipeline = [
+            {"$match": {"user_id": ObjectId(user_id)}},
+            {"$lookup": {
+                "from": "courses",
+                "let": {"course_id": "$course_id"},
+                "pipeline": [
+                    {"$match": {"$expr": {"$eq": ["$_id", "$$course_id"]}}},
+                    {"$project": {
+                        "title": 1,
+                        "total_modules": {"$size": {"$ifNull": ["$modules", []]}}
+                    }}
+                ],
+                "as": "course"
+            }},
+            {"$unwind": "$course"},
+            {"$project": {
+                "_id": 0,
+                "enrollment_id": "$_id",
+                "course_id": "$course._id",
+                "course_title": "$course.title",
+                "enrolled_at": 1,
+                "progress": 1,
+                "total_modules": "$course.total_modules",
+                "completed": {"$ne": [{"$ifNull": ["$completed_at", None]}, None]},
+                "certificate_issued": {"$ifNull": ["$certificate_issued", False]}
+            }}
+        ]
+        return list(enrollments.aggregate(pipeline))
+
+    @staticmethod
+    def update_progress(enrollment_id, module_number, quiz_score=None, user_id=None):
+        """
+        Record a completed module and return the enrollment's progress
+        counters, or None when no matching enrollment exists. Repeats of a
+        module are ignored, as are module numbers beyond the course.
+        """
+        query = {"_id": ObjectId(enrollment_id)}
+        if user_id is not None:
+            query["user_id"] = ObjectId(user_id)
+        return get_enrollments_collection().find_one_and_update(
+            query,
+            progress_update_pipeline(module_number, quiz_score),
+            projection=ENROLLMENT_PROGRESS_PROJECTION,
+            return_document=ReturnDocument.AFTER
         )
 
+    @staticmethod
+    def update_progress_batch(user_id, updates):
+        """
+        Apply many ``(enrollment_id, module_number, quiz_score)`` updates for
+        one user: one ownership query and one unordered bulk write. Returns a
+        status per update: "updated", "unchanged" (module already completed
+        or beyond the course), "not_found" or "failed".
+        """
+        enrollments = get_enrollments_collection()
+        user_id = ObjectId(user_id)
+        enrollment_ids = list({enrollment_id for enrollment_id, _, _ in updates})
+        # Completed modules per owned enrollment, to tell which updates
+        # progress_update_pipeline would actually apply
+        owned = {
+            doc['_id']: (
+                {entry.get('module_number') for entry in doc.get('progress', [])},
+                doc.get('total_modules')
+            )
+            for doc in enrollments.find(
+                {"_id": {"$in": enrollment_ids}, "user_id": user_id},
+                {"progress.module_number": 1, "total_modules": 1}
+            )
+        }
+
+        statuses = ['not_found'] * len(updates)
+        operations, positions = [], []
+        for position, (enrollment_id, module_number, quiz_score) in enumerate(updates):
+            if enrollment_id not in owned:
+                continue
+            completed, total_modules = owned[enrollment_id]
+            if module_number in completed or (total_modules is not None and module_number > total_modules):
+                statuses[position] = 'unchanged'
+                continue
+            completed.add(module_number)
+            operations.append(UpdateOne(
+                {"_id": enrollment_id, "user_id": user_id},
+                progress_update_pipeline(module_number, quiz_score)
+            ))
+            positions.append(position)
+            statuses[position] = 'updated'
+
+        if operations:
+            try:
+                enrollments.bulk_write(operations, ordered=False)
+            except BulkWriteError as e:
+                for error in e.details.get('writeErrors', []):
+                    statuses[positions[error['index']]] = 'failed'
+        return statuses
+
+    @staticmethod
+    def module_counts(enrollment):
+        """
+        ``(completed_modules, total_modules)`` for an enrollment, or None when
+        its course no longer exists. Enrollments created before the counters
+        existed are backfilled from the course.
+        """
+        if 'total_modules' not in enrollment:
+            Enrollment.backfill_counters(enrollment)
+            if 'total_modules' not in enrollment:
+                return None
+        return enrollment.get('completed_modules', 0), enrollment['total_modules']
+
+    @staticmethod
+    def backfill_counters(enrollment):
+        """Add the stored course fields and counters to a legacy enrollment, in place"""
+        course = Course.get_course_by_id(enrollment['course_id'])
+        if not course:
+            return enrollment
+
+        # Legacy progress arrays may repeat modules; keep the first entry of each
+        progress, seen = [], set()
+        for entry in enrollment.get('progress', []):
+            if entry.get('module_number') not in seen:
+                seen.add(entry.get('module_number'))
+                progress.append(entry)
+        total_modules = len(course.get('modules', []))
+        completed_modules = min(len(progress), total_modules)
+        fields = {
+            "progress": progress,
+            "course_title": course['title'],
+            "total_modules": total_modules,
+            "completed_modules": completed_modules,
+            "progress_percentage": round(completed_modules / total_modules * 100, 2) if total_modules else 0,
+            "updated_at": datetime.utcnow()
+        }
+        get_enrollments_collection().update_one({"_id": enrollment['_id']}, {"$set": fields})
+        enrollment.update(fields)
+        return enrollment
+
     @staticmethod
     def mark_course_completed(enrollment_id):
         enrollments = get_enrollments_collection()
@@ -73,7 +402,113 @@ class Enrollment:
             {
                 "$set": {
                     "completed_at": datetime.utcnow(),
-                    "certificate_issued": True
+                    "certificate_issued": True,
+                    "updated_at": datetime.utcnow()
                 }
             }
-        )
\ No newline at end of file
+        )
+
+class Certificate:
+    @staticmethod
+    def issue(enrollment):
+        """
+        Issue the certificate for a finished enrollment and mark the
+        enrollment completed. Returns ``(certificate, created)``.
+
+        The certificate is an upsert keyed on the unique ``enrollment_id``
+        index, so retries and concurrent calls all get the one certificate
+        created first. The enrollment update is repeated on every call, so
+        an interrupted issuance is completed by the next retry.
+        """
+        certificates = get_certificates_collection()
+        certificate_id = new_certificate_id()
+        new_certificate = {
+            "enrollment_id": enrollment['_id'],
+            "user_id": enrollment['user_id'],
+            "course_id": enrollment['course_id'],
+            "certificate_id": certificate_id,
+            "issue_date": datetime.utcnow(),
+            "certificate_url": f"/api/certificates/{certificate_id}",
+            "verification_code": verification_code_for(certificate_id)
+        }
+        new_certificate['updated_at'] = new_certificate['issue_date']
+
+        try:
+            certificate = certificates.find_one_and_update(
+                {"enrollment_id": enrollment['_id']},
+                {"$setOnInsert": new_certificate},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # Lost an upsert race; the winner's certificate exists now
+            certificate = certificates.find_one({"enrollment_id": enrollment['_id']})
+
+        if not enrollment.get('certificate_issued'):
+            get_enrollments_collection().update_one(
+                {"_id": enrollment['_id'], "certificate_issued": {"$ne": True}},
+                {"$set": {
+                    "completed_at": certificate['issue_date'],
+                    "certificate_issued": True,
+                    "certificate_id": certificate['certificate_id'],
+                    "updated_at": datetime.utcnow()
+                }}
+            )
+
+        return certificate, certificate['certificate_id'] == certificate_id
+
+    @staticmethod
+    def get_view(certificate_id):
+        """
+        Public view of a certificate (see build_certificate_view), read
+        through the certificate view cache. None when it does not exist or
+        its course or user is gone.
+        """
+        if certificate_miss_cache.peek(certificate_id):
+            return None
+
+        def load():
+            certificate = get_certificates_collection().find_one({"certificate_id": certificate_id})
+            if not certificate:
+                raise _CertificateMissing()
+            course = Course.get_course_by_id(certificate['course_id'])
+            enrollment = get_enrollments_collection().find_one({"_id": certificate['enrollment_id']})
+            user = get_user_profile(certificate['user_id'])
+            if not course or not user:
+                raise _CertificateMissing()
+            return build_certificate_view(certificate, course, enrollment, user)
+
+        try:
+            view = certificate_view_cache.get_or_load(certificate_id, load)
+        except _CertificateMissing:
+            certificate_miss_cache.put(certificate_id, True)
+            return None
+        return dict(view)
+
+    @staticmethod
+    async def get_view_async(certificate_id):
+        """``get_view`` for the async views, sharing the certificate view cache"""
+        if certificate_miss_cache.peek(certificate_id):
+            return None
+
+        async def load():
+            db = get_async_db()
+            certificate = await db.certificates.find_one({"certificate_id": certificate_id})
+            if not certificate:
+                raise _CertificateMissing()
+            # Course, enrollment and user do not depend on each other
+            course, enrollment, user = await asyncio.gather(
+                Course.get_course_by_id_async(certificate['course_id']),
+                db.enrollments.find_one({"_id": certificate['enrollment_id']}),
+                get_user_profile_async(certificate['user_id'])
+            )
+            if not course or not user:
+                raise _CertificateMissing()
+            return build_certificate_view(certificate, course, enrollment, user)
+
+        try:
+            view = await certificate_view_cache.get_or_load_async(certificate_id, load)
+        except _CertificateMissing:
+            certificate_miss_cache.put(certificate_id, True)
+            return None
+        return dict(view)
@@ -0,0 +1,248 @@
+"""
+MongoDB index registry.
+
+Every index the routes rely on is declared here, next to the models, and
+applied idempotently by ``ensure_indexes`` (at app start-up and through
+``flask ensure-indexes``). ``flask check-indexes`` explains each hot query
+shape and fails if any of them still needs a collection scan.
+"""
+
+import click
+from bson import ObjectId
+from datetime import datetime
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure, PyMongoError
+from app.database import get_db
+from app.models.user import USER_COLLATION
+from app.models.sync import TOMBSTONE_RETENTION, SYNC_SORT
+
+INDEXES = {
+    'users': [
+        # Registration relies on these to reject duplicates atomically
+        IndexModel([('email', ASCENDING)], name='email_unique_ci', unique=True,
+                   collation=USER_COLLATION, background=True),
+        IndexModel([('username', ASCENDING)], name='username_unique_ci', unique=True,
+                   collation=USER_COLLATION, background=True),
+    ],
+    'courses': [
+        # Catalog listing and keyset pagination
+        IndexModel(
+            [('is_published', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)],
+            name='published_created_at', background=True
+        ),
+        # Delta sync
+        IndexModel([('updated_at', ASCENDING), ('_id', ASCENDING)],
+                   name='updated_at', background=True),
+    ],
+    'enrollments': [
+        # One enrollment per user and course; also serves lookups by user_id
+        IndexModel([('user_id', ASCENDING), ('course_id', ASCENDING)],
+                   name='user_course_unique', unique=True, background=True),
+        # Delta sync
+        IndexModel([('user_id', ASCENDING), ('updated_at', ASCENDING), ('_id', ASCENDING)],
+                   name='user_updated_at', background=True),
+    ],
+    'certificates': [
+        IndexModel([('certificate_id', ASCENDING)], name='certificate_id_1',
+                   unique=True, background=True),
+        # One certificate per enrollment; Certificate.issue upserts on it
+        IndexModel([('enrollment_id', ASCENDING)], name='enrollment_id_unique',
+                   unique=True, background=True),
+        # Delta sync; also serves lookups by user_id
+        IndexModel([('user_id', ASCENDING), ('updated_at', ASCENDING), ('_id', ASCENDING)],
+                   name='user_updated_at', background=True),
+    ],
+    'market_listings': [
+        # Market feed (available only) and keyset pagination
+        IndexModel(
+            [('is_available', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)],
+            name='available_created_at', background=True
+        ),
+        # Market feed including unavailable listings
+        IndexModel([('created_at', DESCENDING), ('_id', DESCENDING)],
+                   name='created_at', background=True),
+        # Delta sync
+        IndexModel([('updated_at', ASCENDING), ('_id', ASCENDING)],
+                   name='updated_at', background=True),
+    ],
+    'tombstones': [
+        # Delta sync deletions; expired by MongoDB after the retention period
+        IndexModel([('deleted_at', ASCENDING)], name='deleted_at_ttl',
+                   expireAfterSeconds=int(TOMBSTONE_RETENTION.total_seconds()),
+                   background=True),
+    ],
+}
+
+# Indexes replaced by entries above; dropped once their replacements exist
+RETIRED_INDEXES = {
+    'users': ['email_1', 'username_1'],
+    'enrollments': ['user_id_1'],
+    'certificates': ['enrollment_id_1', 'user_id_1'],
+}
+
+_SAMPLE_ID = ObjectId()
+_SAMPLE_DATE = datetime(2000, 1, 1)
+_PAGE_SORT = [('created_at', DESCENDING), ('_id', DESCENDING)]
+
+# Query shapes issued by the routes in app/routes/, with sample values
+QUERY_SHAPES = [
+    {'name': 'auth: user by email', 'collection': 'users',
+     'filter': {'email': 'user@example.com'}, 'collation': USER_COLLATION},
+    {'name': 'auth: user by username', 'collection': 'users',
+     'filter': {'username': 'user'}, 'collation': USER_COLLATION},
+    {'name': 'courses: catalog page', 'collection': 'courses',
+     'filter': {'is_published': True, 'created_at': {'$lt': _SAMPLE_DATE}},
+     'sort': _PAGE_SORT},
+    {'name': 'courses: enrollments for user', 'collection': 'enrollments',
+     'filter': {'user_id': _SAMPLE_ID}},
+    {'name': 'courses: enrollment for user and course', 'collection': 'enrollments',
+     'filter': {'user_id': _SAMPLE_ID, 'course_id': _SAMPLE_ID}},
+    {'name': 'courses: certificate by id', 'collection': 'certificates',
+     'filter': {'certificate_id': 'AGRO-0000000000000000'}},
+    {'name': 'courses: certificate by enrollment', 'collection': 'certificates',
+     'filter': {'enrollment_id': _SAMPLE_ID}},
+    {'name': 'courses: certificates for user', 'collection': 'certificates',
+     'filter': {'user_id': _SAMPLE_ID}},
+    {'name': 'market: available listings page', 'collection': 'market_listings',
+     'filter': {'is_available': True}, 'sort': _PAGE_SORT},
+    {'name': 'market: all listings page', 'collection': 'market_listings',
+     'filter': {}, 'sort': _PAGE_SORT},
+    {'name': 'sync: changed courses', 'collection': 'courses',
+     'filter': {'updated_at': {'$gte': _SAMPLE_DATE}}, 'sort': SYNC_SORT},
+    {'name': 'sync: changed listings', 'collection': 'market_listings',
+     'filter': {'updated_at': {'$gte': _SAMPLE_DATE}}, 'sort': SYNC_SORT},
+    {'name': 'sync: changed enrollments', 'collection': 'enrollments',
+     'filter': {'user_id': _SAMPLE_ID, 'updated_at': {'$gte': _SAMPLE_DATE}}, 'sort': SYNC_SORT},
+    {'name': 'sync: changed certificates', 'collection': 'certificates',
+     'filter': {'user_id': _SAMPLE_ID, 'updated_at': {'$gte': _SAMPLE_DATE}}, 'sort': SYNC_SORT},
+    {'name': 'sync: tombstones', 'collection': 'tombstones',
+     'filter': {'deleted_at': {'$gte': _SAMPLE_DATE}}},
+]
+
+class MissingUniqueIndexes(RuntimeError):
+    """Unique indexes that the writes rely on could not be built"""
+
+# How to clear the duplicates that block a collection's unique indexes
+DEDUPE_COMMANDS = {
+    'users': 'flask report-duplicate-users',
+    'enrollments': 'flask dedupe-enrollments',
+    'certificates': 'flask dedupe-certificates',
+}
+
+def ensure_indexes(db=None, logger=None):
+    """
+    Create every registered index, one at a time so a failure does not skip
+    the rest, and drop retired ones once their collection built cleanly.
+    Existing indexes are left alone, so this is safe to run on every
+    start-up. Returns the names that were applied.
+
+    Registration, enrollment and certificate issuance depend on the unique
+    indexes to reject duplicates, so after trying everything this raises
+    MissingUniqueIndexes if any of them could not be built (usually because
+    existing data already has duplicates).
+    """
+    db = db if db is not None else get_db()
+    applied = []
+    missing_unique = []
+    for collection, models in INDEXES.items():
+        failed = False
+        for model in models:
+            try:
+                applied.extend(db[collection].create_indexes([model]))
+            except OperationFailure as e:
+                failed = True
+                name = model.document['name']
+                if model.document.get('unique'):
+                    remedy = DEDUPE_COMMANDS.get(collection)
+                    missing_unique.append(
+                        f"{collection}.{name}: {str(e)}" + (f" (run `{remedy}`)" if remedy else '')
+                    )
+                elif logger is None:
+                    raise
+                else:
+                    logger.error(f"Failed to build index {collection}.{name}: {str(e)}")
+        if not failed:
+            existing = set(db[collection].index_information())
+            for name in RETIRED_INDEXES.get(collection, []):
+                if name in existing:
+                    db[collection].drop_index(name)
+    if missing_unique:
+        raise MissingUniqueIndexes(
+            'Unique indexes could not be built:\n  ' + '\n  '.join(missing_unique)
+        )
+    return applied
+
+def _plan_stages(plan):
+    """Yield every stage name in an explain plan tree"""
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            yield plan['stage']
+        for value in plan.values():
+            yield from _plan_stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from _plan_stages(item)
+
+def check_indexes(db=None):
+    """
+    Explain every registered query shape. Returns ``(name, stages)`` for the
+    shapes whose winning plan contains a COLLSCAN.
+    """
+    db = db if db is not None else get_db()
+    failures = []
+    for shape in QUERY_SHAPES:
+        cursor = db[shape['collection']].find(shape['filter'], collation=shape.get('collation'))
+        if shape.get('sort'):
+            cursor = cursor.sort(shape['sort'])
+        winning_plan = cursor.limit(1).explain()['queryPlanner']['winningPlan']
+        stages = list(_plan_stages(winning_plan))
+        if 'COLLSCAN' in stages:
+            failures.append((shape['name'], stages))
+    return failures
+
+def loading_for_app_command():
+    """
+    True while the Flask CLI loads the app to find one of the commands
+    registered on ``app.cli``. Built-in commands such as ``run`` and
+    ``shell`` load it from inside their own context instead.
+    """
+    ctx = click.get_current_context(silent=True)
+    return ctx is not None and isinstance(ctx.command, click.Group)
+
+def init_app(app):
+    """
+    Apply the registry at start-up and register the CLI commands. Refuses
+    to start when a unique index is missing.
+    """
+    if app.config.get('MONGO_ENSURE_INDEXES', True):
+        try:
+            ensure_indexes(logger=app.logger)
+        except PyMongoError as e:
+            app.logger.warning(f"Index build skipped: {str(e)}")
+        except MissingUniqueIndexes as e:
+            # The app's own CLI commands (index, dedupe and backfill
+            # maintenance) still load so the duplicates can be fixed.
+            # Servers, `flask run` and `flask shell` refuse to start.
+            if not loading_for_app_command():
+                raise
+            app.logger.error(str(e))
+
+    @app.cli.command('ensure-indexes')
+    def ensure_indexes_command():
+        """Create all registered MongoDB indexes."""
+        try:
+            names = ensure_indexes()
+        except MissingUniqueIndexes as e:
+            click.echo(str(e), err=True)
+            raise SystemExit(1)
+        click.echo(f"Applied {len(names)} indexes: {', '.join(names)}")
+
+    @app.cli.command('check-indexes')
+    def check_indexes_command():
+        """Fail if any hot query shape still needs a collection scan."""
+        failures = check_indexes()
+        for name, stages in failures:
+            click.echo(f"COLLSCAN: {name} ({' -> '.join(stages)})", err=True)
+        if failures:
+            raise SystemExit(1)
+        click.echo(f"All {len(QUERY_SHAPES)} query shapes use an index")
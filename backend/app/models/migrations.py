@@ -0,0 +1,184 @@
+"""
+Data clean-ups that let the unique indexes in app/models/indexes.py build
+on databases written before those indexes existed. Each is idempotent and
+exposed as a Flask CLI command; run them, then ``flask ensure-indexes``.
+"""
+
+import click
+from datetime import datetime
+from app.database import get_db
+from app.models.sync import record_tombstone
+from app.models.user import USER_COLLATION
+
+def archive_certificate(db, certificate, superseded_by=None):
+    """
+    Move a duplicate certificate to certificates_archive so the unique
+    enrollment_id index can build. It stays on record for support queries,
+    and a tombstone removes it from synced clients.
+    """
+    db.certificates_archive.insert_one({
+        **certificate,
+        'archived_at': datetime.utcnow(),
+        'superseded_by': superseded_by
+    })
+    db.certificates.delete_one({'_id': certificate['_id']})
+    record_tombstone('certificates', certificate['_id'], certificate.get('user_id'), db)
+
+def merge_enrollments(keeper, duplicates):
+    """Fields to $set on the kept enrollment so no progress is lost"""
+    enrollments = [keeper] + duplicates
+
+    # One progress entry per module, keeping the earliest completion
+    progress = {}
+    for enrollment in enrollments:
+        for entry in enrollment.get('progress', []):
+            current = progress.get(entry.get('module_number'))
+            if current is None or (entry.get('completed_at') or datetime.max) < (current.get('completed_at') or datetime.max):
+                progress[entry.get('module_number')] = entry
+    merged = {
+        'progress': sorted(progress.values(), key=lambda entry: entry.get('completed_at') or datetime.max),
+        'certificate_issued': any(e.get('certificate_issued') for e in enrollments),
+        'updated_at': datetime.utcnow()
+    }
+
+    completed_at = [e['completed_at'] for e in enrollments if e.get('completed_at')]
+    merged['completed_at'] = min(completed_at) if completed_at else None
+    for field in ('course_title', 'total_modules', 'certificate_id'):
+        value = next((e[field] for e in enrollments if e.get(field) is not None), None)
+        if value is not None:
+            merged[field] = value
+
+    if 'total_modules' in merged:
+        total_modules = merged['total_modules']
+        completed_modules = len([
+            entry for entry in merged['progress']
+            if isinstance(entry.get('module_number'), int) and entry['module_number'] <= total_modules
+        ])
+        merged['completed_modules'] = completed_modules
+        merged['progress_percentage'] = round(completed_modules / total_modules * 100, 2) if total_modules else 0
+    return merged
+
+def dedupe_enrollments(db=None):
+    """
+    Merge enrollments that share (user_id, course_id) into the oldest one.
+    Progress is merged per module and completion carried over. Certificates
+    of the removed enrollments move to the kept one, or to the archive if
+    it already has one. Returns the number of enrollments removed.
+    """
+    db = db if db is not None else get_db()
+    groups = db.enrollments.aggregate([
+        {'$group': {
+            '_id': {'user_id': '$user_id', 'course_id': '$course_id'},
+            'ids': {'$push': '$_id'},
+            'count': {'$sum': 1}
+        }},
+        {'$match': {'count': {'$gt': 1}}}
+    ], allowDiskUse=True)
+
+    removed = 0
+    for group in groups:
+        enrollments = sorted(
+            db.enrollments.find({'_id': {'$in': group['ids']}}),
+            key=lambda e: (e.get('enrolled_at') or datetime.max, e['_id'])
+        )
+        keeper, duplicates = enrollments[0], enrollments[1:]
+        duplicate_ids = [e['_id'] for e in duplicates]
+
+        kept_certificate = db.certificates.find_one({'enrollment_id': keeper['_id']})
+        for certificate in db.certificates.find({'enrollment_id': {'$in': duplicate_ids}}):
+            if kept_certificate is None:
+                db.certificates.update_one(
+                    {'_id': certificate['_id']},
+                    {'$set': {'enrollment_id': keeper['_id'], 'updated_at': datetime.utcnow()}}
+                )
+                kept_certificate = certificate
+            else:
+                archive_certificate(db, certificate, kept_certificate['certificate_id'])
+
+        merged = merge_enrollments(keeper, duplicates)
+        if kept_certificate is not None:
+            merged['certificate_id'] = kept_certificate['certificate_id']
+            merged['certificate_issued'] = True
+        db.enrollments.update_one({'_id': keeper['_id']}, {'$set': merged})
+        db.enrollments.delete_many({'_id': {'$in': duplicate_ids}})
+        for enrollment in duplicates:
+            record_tombstone('enrollments', enrollment['_id'], enrollment.get('user_id'), db)
+        removed += len(duplicate_ids)
+    return removed
+
+def dedupe_certificates(db=None):
+    """
+    Keep the earliest certificate of each enrollment and archive the rest,
+    then point the enrollment at the kept one. Returns the number archived.
+    """
+    db = db if db is not None else get_db()
+    groups = db.certificates.aggregate([
+        {'$match': {'enrollment_id': {'$ne': None}}},
+        {'$group': {'_id': '$enrollment_id', 'ids': {'$push': '$_id'}, 'count': {'$sum': 1}}},
+        {'$match': {'count': {'$gt': 1}}}
+    ], allowDiskUse=True)
+
+    archived = 0
+    for group in groups:
+        certificates = sorted(
+            db.certificates.find({'_id': {'$in': group['ids']}}),
+            key=lambda c: (c.get('issue_date') or datetime.max, c['_id'])
+        )
+        kept = certificates[0]
+        for certificate in certificates[1:]:
+            archive_certificate(db, certificate, kept['certificate_id'])
+            archived += 1
+        db.enrollments.update_one(
+            {'_id': group['_id']},
+            {'$set': {
+                'certificate_id': kept['certificate_id'],
+                'certificate_issued': True,
+                'updated_at': datetime.utcnow()
+            }}
+        )
+    return archived
+
+def find_duplicate_users(db=None):
+    """
+    Users whose email or username collide under the case-insensitive
+    collation of the unique indexes. Returns ``(field, [users])`` groups.
+    Accounts own enrollments, certificates and listings, so they are not
+    merged automatically; rename or remove all but one of each group.
+    """
+    db = db if db is not None else get_db()
+    duplicates = []
+    for field in ('email', 'username'):
+        groups = db.users.aggregate([
+            {'$match': {field: {'$type': 'string'}}},
+            {'$group': {'_id': f'${field}', 'ids': {'$push': '$_id'}, 'count': {'$sum': 1}}},
+            {'$match': {'count': {'$gt': 1}}}
+        ], collation=USER_COLLATION, allowDiskUse=True)
+        for group in groups:
+            users = list(db.users.find(
+                {'_id': {'$in': group['ids']}}, {'email': 1, 'username': 1, 'created_at': 1}
+            ).sort('created_at', 1))
+            duplicates.append((field, users))
+    return duplicates
+
+def init_app(app):
+    @app.cli.command('dedupe-enrollments')
+    def dedupe_enrollments_command():
+        """Merge duplicate (user, course) enrollments into the oldest one."""
+        click.echo(f"Removed {dedupe_enrollments()} duplicate enrollments")
+
+    @app.cli.command('dedupe-certificates')
+    def dedupe_certificates_command():
+        """Keep one certificate per enrollment and archive the others."""
+        click.echo(f"Archived {dedupe_certificates()} duplicate certificates")
+
+    @app.cli.command('report-duplicate-users')
+    def report_duplicate_users_command():
+        """List users whose email or username differ only by case."""
+        duplicates = find_duplicate_users()
+        for field, users in duplicates:
+            click.echo(f"Duplicate {field}:")
+            for user in users:
+                click.echo(f"  {user['_id']}  {user.get('username')}  {user.get('email')}  {user.get('created_at')}")
+        if duplicates:
+            raise SystemExit(1)
+        click.echo('No duplicate users')
@@ -0,0 +1,99 @@
+import click
+from datetime import datetime, timedelta
+from pymongo import ASCENDING
+from app.database import get_db
+
+"""
+Tombstone document structure:
+{
+    _id: ObjectId,
+    collection: String,     # 'courses', 'market_listings', 'enrollments', 'certificates'
+    doc_id: ObjectId,       # _id of the deleted document
+    user_id: ObjectId,      # owner, for per-user collections; None otherwise
+    deleted_at: DateTime
+}
+"""
+
+# Tombstones expire after this long (TTL index in app/models/indexes.py).
+# Clients whose watermark is older must start over with a full sync.
+TOMBSTONE_RETENTION = timedelta(days=90)
+
+# Collections returned by /api/sync, with the owner field of per-user ones
+SYNC_COLLECTIONS = {
+    'courses': None,
+    'market_listings': None,
+    'enrollments': 'user_id',
+    'certificates': 'user_id'
+}
+
+SYNC_SORT = [('updated_at', ASCENDING), ('_id', ASCENDING)]
+
+def resume_query(query, after):
+    """
+    Restrict ``query`` to documents that sort after the ``(updated_at, _id)``
+    key ``after`` in SYNC_SORT order. The _id tiebreaker keeps a section
+    moving even when more than a page of documents share one updated_at.
+    """
+    if not after:
+        return query
+
+    updated_at, last_id = after
+    if updated_at is None:
+        # Documents without updated_at sort first
+        after_key = {'$or': [
+            {'updated_at': None, '_id': {'$gt': last_id}},
+            {'updated_at': {'$ne': None}}
+        ]}
+    else:
+        after_key = {'$or': [
+            {'updated_at': {'$gt': updated_at}},
+            {'updated_at': updated_at, '_id': {'$gt': last_id}}
+        ]}
+    return {'$and': [query, after_key]}
+
+def record_tombstone(collection, doc_id, user_id=None, db=None):
+    """Call after deleting a document so syncing clients drop it too"""
+    db = db if db is not None else get_db()
+    db.tombstones.insert_one({
+        'collection': collection,
+        'doc_id': doc_id,
+        'user_id': user_id,
+        'deleted_at': datetime.utcnow()
+    })
+
+def deleted_since(since, user_id=None):
+    """Ids deleted at or after ``since``, grouped by collection"""
+    owners = [None] if user_id is None else [None, user_id]
+    deleted = {}
+    for tombstone in get_db().tombstones.find(
+        {'deleted_at': {'$gte': since}, 'user_id': {'$in': owners}},
+        {'collection': 1, 'doc_id': 1}
+    ):
+        deleted.setdefault(tombstone['collection'], []).append(tombstone['doc_id'])
+    return deleted
+
+def backfill_updated_at(db=None):
+    """
+    Give documents written before updated_at was maintained one, so delta
+    sync can see them. Uses created_at/enrolled_at/issue_date when present.
+    Returns the number of documents updated per collection.
+    """
+    db = db if db is not None else get_db()
+    now = datetime.utcnow()
+    counts = {}
+    for collection in SYNC_COLLECTIONS:
+        result = db[collection].update_many(
+            {'updated_at': {'$exists': False}},
+            [{'$set': {'updated_at': {'$ifNull': ['$created_at', {'$ifNull': [
+                '$enrolled_at', {'$ifNull': ['$issue_date', {'$literal': now}]}
+            ]}]}}}]
+        )
+        counts[collection] = result.modified_count
+    return counts
+
+def init_app(app):
+    @app.cli.command('backfill-updated-at')
+    def backfill_updated_at_command():
+        """Add updated_at to documents that predate delta sync."""
+        for collection, count in backfill_updated_at().items():
+            click.echo(f"{collection}: {count} documents updated")
@@ -1,6 +1,10 @@
 from werkzeug.security import generate_password_hash, check_password_hash
 from bson.objectid import ObjectId
+from pymongo.collation import Collation
 from datetime import datetime
+from app.async_database import get_async_db
+from app.cache import TTLCache
+from app.database import get_db
 
 """
 User document structure:
@@ -15,6 +19,60 @@ User document structure:
 }
 """
 
+# Emails and usernames are unique and matched case-insensitively. Queries
+# must pass this collation to use the unique indexes in app/models/indexes.py.
+USER_COLLATION = Collation(locale='en', strength=2)
+
+# Index key -> 409 message for duplicate registrations
+DUPLICATE_USER_MESSAGES = {
+    'email': 'Email already exists',
+    'username': 'Username already exists'
+}
+
+# Fields safe to hold in memory and hand to views; never the password hash
+USER_PROFILE_PROJECTION = {
+    'username': 1,
+    'email': 1,
+    'first_name': 1,
+    'last_name': 1,
+    'user_type': 1,
+    'location': 1,
+    'created_at': 1
+}
+
+# Per-process cache of profile views keyed by user _id
+profile_cache = TTLCache(maxsize=10000, ttl=60)
+
+def get_user_profile(user_id):
+    """
+    Projected, non-sensitive view of a user, read through the profile cache.
+    Returns None when the user does not exist.
+    """
+    if isinstance(user_id, str):
+        user_id = ObjectId(user_id)
+    profile = profile_cache.get_or_load(
+        user_id, lambda: get_db().users.find_one({'_id': user_id}, USER_PROFILE_PROJECTION)
+    )
+    # Callers get their own copy to modify
+    return dict(profile) if profile is not None else None
+
+async def get_user_profile_async(user_id):
+    """``get_user_profile`` for the async views, sharing the profile cache"""
+    if isinstance(user_id, str):
+        user_id = ObjectId(user_id)
+
+    async def load():
+        return await get_async_db().users.find_one({'_id': user_id}, USER_PROFILE_PROJECTION)
+
+    profile = await profile_cache.get_or_load_async(user_id, load)
+    return dict(profile) if profile is not None else None
+
+def invalidate_user_profile(user_id):
+    """Drop a cached profile; call after any write to the user's document"""
+    if isinstance(user_id, str):
+        user_id = ObjectId(user_id)
+    profile_cache.pop(user_id)
+
 def create_user(mongo, username, email, password, user_type, location=None):
     """Create a new user document"""
     user = {
@@ -3,16 +3,25 @@ D'Agri Talk Application Monitoring
 Comprehensive monitoring and metrics collection
 """
 
+import atexit
+import os
 import time
 import logging
 import json
+import threading
 from datetime import datetime, timedelta
 from functools import wraps
 from flask import request, g, current_app
 import psutil
 import boto3
-from prometheus_client import Counter, Histogram, Gauge, generate_latest
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+    generate_latest, multiprocess
+)
+from prometheus_client.core import GaugeMetricFamily
+from pymongo.errors import PyMongoError
 import structlog
+from app.cache import TTLCache
 
 # Configure structured logging
 structlog.configure(
@@ -48,46 +57,322 @@ REQUEST_DURATION = Histogram(
     ['method', 'endpoint']
 )
 
+# Pre-forked workers each hold their own metric values. When
+# PROMETHEUS_MULTIPROC_DIR is set, prometheus_client writes them to shared
+# files and /metrics merges every worker's values at scrape time.
+def multiprocess_mode_enabled():
+    return bool(os.environ.get('PROMETHEUS_MULTIPROC_DIR'))
+
 ACTIVE_USERS = Gauge(
     'dagri_talk_active_users',
-    'Number of active users'
+    'Number of active users',
+    multiprocess_mode='livesum'
 )
 
 DATABASE_CONNECTIONS = Gauge(
     'dagri_talk_database_connections',
-    'Number of active database connections'
+    'Number of active database connections',
+    multiprocess_mode='livesum'
 )
 
-COURSES_COUNT = Gauge(
-    'dagri_talk_courses_total',
-    'Total number of courses'
+ERROR_COUNT = Counter(
+    'dagri_talk_errors_total',
+    'Total number of application errors',
+    ['error_type', 'endpoint']
 )
 
-MARKET_LISTINGS = Gauge(
-    'dagri_talk_market_listings_total',
-    'Total number of market listings'
+RESPONSE_SIZE = Histogram(
+    'dagri_talk_response_size_bytes',
+    'HTTP response body size in bytes, counted as the body is sent',
+    ['method', 'endpoint'],
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
 )
 
-SYSTEM_CPU = Gauge(
-    'dagri_talk_system_cpu_percent',
-    'System CPU usage percentage'
+CLOUDWATCH_DROPPED = Counter(
+    'dagri_talk_cloudwatch_dropped_total',
+    'CloudWatch datapoints dropped before or during shipping',
+    ['reason']
 )
 
-SYSTEM_MEMORY = Gauge(
-    'dagri_talk_system_memory_percent',
-    'System memory usage percentage'
-)
+# put_metric_data accepts at most 1000 metrics per call
+CLOUDWATCH_BATCH_SIZE = 1000
 
-ERROR_COUNT = Counter(
-    'dagri_talk_errors_total',
-    'Total number of application errors',
-    ['error_type', 'endpoint']
-)
+class CloudWatchSink:
+    """Ships aggregated metric data to CloudWatch"""
+
+    def __init__(self, client, namespace):
+        self.client = client
+        self.namespace = namespace
+
+    def send(self, metric_data):
+        for start in range(0, len(metric_data), CLOUDWATCH_BATCH_SIZE):
+            self.client.put_metric_data(
+                Namespace=self.namespace,
+                MetricData=metric_data[start:start + CLOUDWATCH_BATCH_SIZE]
+            )
+
+class StubMetricsSink:
+    """Keeps flushed metric data in memory, for offline runs and tests"""
+
+    def __init__(self, max_batches=100):
+        self.max_batches = max_batches
+        self.batches = []
+
+    def send(self, metric_data):
+        self.batches.append(list(metric_data))
+        del self.batches[:-self.max_batches]
+
+class MetricsAggregator:
+    """
+    Accumulates per-endpoint request statistics in memory and ships them as
+    CloudWatch StatisticSets from a background thread every
+    ``flush_interval`` seconds. Recording a request is a dict update under
+    a lock; the request never waits on the CloudWatch API. The number of
+    distinct (endpoint, status) series per interval is bounded by
+    ``max_series``; requests beyond it are counted as dropped.
+    """
+
+    def __init__(self, sink=None, flush_interval=60, max_series=1000,
+                 high_resolution=False, environment='development'):
+        self.sink = sink
+        self.flush_interval = flush_interval
+        self.max_series = max_series
+        self.high_resolution = high_resolution
+        self.environment = environment
+        self.dropped = 0
+        self.failed_flushes = 0
+        self._series = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread_pid = None
+        self._stop_registered = False
+
+    def record(self, endpoint, status_code, duration):
+        key = (endpoint, status_code)
+        with self._lock:
+            stats = self._series.get(key)
+            if stats is None:
+                if len(self._series) >= self.max_series:
+                    self.dropped += 1
+                    CLOUDWATCH_DROPPED.labels(reason='max_series').inc()
+                    return
+                self._series[key] = [1, duration, duration, duration]
+                return
+            stats[0] += 1
+            stats[1] += duration
+            if duration < stats[2]:
+                stats[2] = duration
+            if duration > stats[3]:
+                stats[3] = duration
+
+    def _metric_data(self, series, timestamp):
+        resolution = {'StorageResolution': 1} if self.high_resolution else {}
+        environment = {'Name': 'Environment', 'Value': self.environment}
+        metric_data = []
+        for (endpoint, status_code), (count, total, minimum, maximum) in series.items():
+            endpoint_dimension = {'Name': 'Endpoint', 'Value': endpoint}
+            metric_data.append({
+                'MetricName': 'RequestDuration',
+                'Timestamp': timestamp,
+                'StatisticValues': {
+                    'SampleCount': count,
+                    'Sum': total,
+                    'Minimum': minimum,
+                    'Maximum': maximum
+                },
+                'Unit': 'Seconds',
+                'Dimensions': [endpoint_dimension, environment],
+                **resolution
+            })
+            metric_data.append({
+                'MetricName': 'RequestCount',
+                'Timestamp': timestamp,
+                'Value': count,
+                'Unit': 'Count',
+                'Dimensions': [
+                    endpoint_dimension,
+                    {'Name': 'StatusCode', 'Value': str(status_code)},
+                    environment
+                ],
+                **resolution
+            })
+        return metric_data
+
+    def flush(self):
+        """Ship everything recorded since the last flush"""
+        with self._lock:
+            series, self._series = self._series, {}
+        if not series or self.sink is None:
+            return
+
+        metric_data = self._metric_data(series, datetime.utcnow())
+        try:
+            self.sink.send(metric_data)
+        except Exception as e:
+            self.failed_flushes += 1
+            self.dropped += len(metric_data)
+            CLOUDWATCH_DROPPED.labels(reason='send_failed').inc(len(metric_data))
+            logger.warning("Failed to send CloudWatch metrics", error=str(e))
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def start(self):
+        """Start the flush thread for this process (no-op if running)"""
+        pid = os.getpid()
+        if self._thread_pid == pid or self.sink is None:
+            return
+        with self._lock:
+            if self._thread_pid == pid:
+                return
+            # Series recorded by a parent process are not ours to ship
+            self._series = {}
+            self._stop = threading.Event()
+            self._thread_pid = pid
+            # Once per process: ship the last partial interval on exit.
+            # Forked workers inherit the handler along with this flag.
+            if not self._stop_registered:
+                atexit.register(self.stop)
+                self._stop_registered = True
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def stop(self):
+        """
+        Stop the flush thread and ship what is left. Called at exit and from
+        the server's worker_exit hook; safe to call more than once.
+        """
+        self._stop.set()
+        if self._thread_pid == os.getpid():
+            self.flush()
+
+# Scrape collectors currently in the default registry. The registry is
+# process-wide, so a second init_app (tests, the ASGI app, a reloader)
+# swaps them instead of registering duplicate time series.
+_registered_collectors = []
+_registered_lock = threading.Lock()
+
+def register_scrape_collectors(collectors):
+    """Put ``collectors`` in the default registry in place of earlier ones"""
+    with _registered_lock:
+        for collector in _registered_collectors:
+            REGISTRY.unregister(collector)
+        _registered_collectors[:] = []
+        for collector in collectors:
+            REGISTRY.register(collector)
+            _registered_collectors.append(collector)
+
+class SystemMetricsCollector:
+    """Host CPU and memory usage, read when /metrics is scraped"""
+
+    def describe(self):
+        # Registering a collector without describe() makes the registry call
+        # collect() on the spot; the names are all it needs
+        yield GaugeMetricFamily('dagri_talk_system_cpu_percent', 'System CPU usage percentage')
+        yield GaugeMetricFamily('dagri_talk_system_memory_percent', 'System memory usage percentage')
+
+    def collect(self):
+        yield GaugeMetricFamily(
+            'dagri_talk_system_cpu_percent',
+            'System CPU usage percentage',
+            # Usage since the previous scrape; does not block
+            value=psutil.cpu_percent(interval=None)
+        )
+        yield GaugeMetricFamily(
+            'dagri_talk_system_memory_percent',
+            'System memory usage percentage',
+            value=psutil.virtual_memory().percent
+        )
+
+class CollectionCountCollector:
+    """
+    Document counts per collection, from ``estimated_document_count``
+    (collection metadata, not a scan). Counts are cached for ``ttl``
+    seconds and refreshed in the background, so a scrape never waits on
+    MongoDB once the first value is in.
+    """
+
+    COLLECTIONS = {
+        'courses': ('dagri_talk_courses_total', 'Total number of courses'),
+        'market_listings': ('dagri_talk_market_listings_total', 'Total number of market listings'),
+        'users': ('dagri_talk_users_total', 'Total number of users'),
+        'enrollments': ('dagri_talk_enrollments_total', 'Total number of course enrollments'),
+    }
+
+    def __init__(self, get_db, ttl=60):
+        self.get_db = get_db
+        self.cache = TTLCache(maxsize=1, ttl=ttl, stale_ttl=ttl * 10)
+
+    def _load_counts(self):
+        db = self.get_db()
+        return {
+            collection: db[collection].estimated_document_count()
+            for collection in self.COLLECTIONS
+        }
+
+    def describe(self):
+        # Without this, registering would count documents at start-up
+        for name, documentation in self.COLLECTIONS.values():
+            yield GaugeMetricFamily(name, documentation)
+
+    def collect(self):
+        try:
+            counts = self.cache.get_or_load('counts', self._load_counts)
+        except PyMongoError as e:
+            logger.warning("Collection counts unavailable", error=str(e))
+            return
+        for collection, (name, documentation) in self.COLLECTIONS.items():
+            yield GaugeMetricFamily(name, documentation, value=counts[collection])
+
+# WSGI environ keys used to hand request details to the size middleware
+ENDPOINT_ENVIRON_KEY = 'dagri_talk.endpoint'
+REQUEST_ID_ENVIRON_KEY = 'dagri_talk.request_id'
+
+class ResponseSizeMiddleware:
+    """
+    WSGI middleware that counts response body bytes as the server consumes
+    the iterable, so streamed responses are measured without buffering
+    """
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        return _CountingIterable(self.wsgi_app(environ, start_response), environ)
+
+class _CountingIterable:
+    def __init__(self, iterable, environ):
+        self.iterable = iterable
+        self.environ = environ
+        self.size = 0
+
+    def __iter__(self):
+        for chunk in self.iterable:
+            self.size += len(chunk)
+            yield chunk
+
+    def close(self):
+        try:
+            if hasattr(self.iterable, 'close'):
+                self.iterable.close()
+        finally:
+            endpoint = self.environ.get(ENDPOINT_ENVIRON_KEY, 'unknown')
+            RESPONSE_SIZE.labels(
+                method=self.environ.get('REQUEST_METHOD', ''),
+                endpoint=endpoint
+            ).observe(self.size)
+            logger.debug(
+                "Response sent",
+                request_id=self.environ.get(REQUEST_ID_ENVIRON_KEY, 'unknown'),
+                endpoint=endpoint,
+                response_size=self.size
+            )
 
 class ApplicationMonitor:
     def __init__(self, app=None):
         self.app = app
-        self.cloudwatch = None
+        self.metrics = MetricsAggregator()
+        self.scrape_collectors = []
         
         if app is not None:
             self.init_app(app)
@@ -96,22 +381,43 @@ class ApplicationMonitor:
         """Initialize monitoring for Flask app"""
         self.app = app
         
-        # Initialize CloudWatch client
-        try:
-            self.cloudwatch = boto3.client('cloudwatch', region_name='us-east-1')
-        except Exception as e:
-            logger.warning("CloudWatch client initialization failed", error=str(e))
+        # Aggregate CloudWatch metrics in memory; a background thread ships them
+        sink = None
+        if app.config.get('CLOUDWATCH_SINK', 'cloudwatch') == 'stub':
+            sink = StubMetricsSink()
+        else:
+            try:
+                client = boto3.client('cloudwatch', region_name=app.config.get('CLOUDWATCH_REGION', 'us-east-1'))
+                sink = CloudWatchSink(client, app.config.get('CLOUDWATCH_NAMESPACE', 'DAgriTalk/Application'))
+            except Exception as e:
+                logger.warning("CloudWatch client initialization failed", error=str(e))
+        
+        self.metrics = MetricsAggregator(
+            sink=sink,
+            flush_interval=app.config.get('CLOUDWATCH_FLUSH_INTERVAL', 60),
+            max_series=app.config.get('CLOUDWATCH_MAX_SERIES', 1000),
+            high_resolution=app.config.get('CLOUDWATCH_HIGH_RESOLUTION', False),
+            environment=app.config.get('ENV', 'development')
+        )
+        
+        # Count response bytes as they are sent rather than buffering bodies
+        app.wsgi_app = ResponseSizeMiddleware(app.wsgi_app)
         
         # Register monitoring hooks
         app.before_request(self.before_request)
         app.after_request(self.after_request)
-        app.teardown_appcontext(self.teardown_request)
+        app.teardown_request(self.teardown_request)
         
-        # Register metrics endpoint
+        # Register metrics endpoint. System and collection gauges are
+        # computed when it is scraped; no worker runs a polling thread.
+        from app.database import get_db
+        self.scrape_collectors = [
+            SystemMetricsCollector(),
+            CollectionCountCollector(get_db, ttl=app.config.get('METRICS_COUNT_CACHE_TTL', 60))
+        ]
+        if not multiprocess_mode_enabled():
+            register_scrape_collectors(self.scrape_collectors)
         app.add_url_rule('/metrics', 'metrics', self.metrics_endpoint)
-        
-        # Start background monitoring
-        self.start_background_monitoring()
     
     def before_request(self):
         """Record request start time"""
@@ -131,17 +437,20 @@ class ApplicationMonitor:
         """Record request completion and metrics"""
         if hasattr(g, 'start_time'):
             duration = time.time() - g.start_time
+            endpoint = request.endpoint or 'unknown'
+            request.environ[ENDPOINT_ENVIRON_KEY] = endpoint
+            request.environ[REQUEST_ID_ENVIRON_KEY] = getattr(g, 'request_id', 'unknown')
             
             # Record Prometheus metrics
             REQUEST_COUNT.labels(
                 method=request.method,
-                endpoint=request.endpoint or 'unknown',
+                endpoint=endpoint,
                 status_code=response.status_code
             ).inc()
             
             REQUEST_DURATION.labels(
                 method=request.method,
-                endpoint=request.endpoint or 'unknown'
+                endpoint=endpoint
             ).observe(duration)
             
             # Log request completion
@@ -152,11 +461,12 @@ class ApplicationMonitor:
                 path=request.path,
                 status_code=response.status_code,
                 duration=duration,
-                response_size=len(response.get_data())
+                content_length=response.content_length
             )
             
-            # Send metrics to CloudWatch
-            self.send_cloudwatch_metrics(duration, response.status_code)
+            # Aggregated in memory; shipped to CloudWatch in the background
+            self.metrics.start()
+            self.metrics.record(endpoint, response.status_code, duration)
         
         return response
     
@@ -177,82 +487,17 @@ class ApplicationMonitor:
                 path=request.path
             )
     
-    def send_cloudwatch_metrics(self, duration, status_code):
-        """Send custom metrics to CloudWatch"""
-        if not self.cloudwatch:
-            return
-        
-        try:
-            self.cloudwatch.put_metric_data(
-                Namespace='DAgriTalk/Application',
-                MetricData=[
-                    {
-                        'MetricName': 'RequestDuration',
-                        'Value': duration,
-                        'Unit': 'Seconds',
-                        'Dimensions': [
-                            {
-                                'Name': 'Environment',
-                                'Value': current_app.config.get('ENV', 'development')
-                            }
-                        ]
-                    },
-                    {
-                        'MetricName': 'RequestCount',
-                        'Value': 1,
-                        'Unit': 'Count',
-                        'Dimensions': [
-                            {
-                                'Name': 'StatusCode',
-                                'Value': str(status_code)
-                            },
-                            {
-                                'Name': 'Environment',
-                                'Value': current_app.config.get('ENV', 'development')
-                            }
-                        ]
-                    }
-                ]
-            )
-        except Exception as e:
-            logger.warning("Failed to send CloudWatch metrics", error=str(e))
-    
-    def start_background_monitoring(self):
-        """Start background system monitoring"""
-        import threading
-        
-        def monitor_system():
-            while True:
-                try:
-                    # System metrics
-                    cpu_percent = psutil.cpu_percent(interval=1)
-                    memory_percent = psutil.virtual_memory().percent
-                    
-                    SYSTEM_CPU.set(cpu_percent)
-                    SYSTEM_MEMORY.set(memory_percent)
-                    
-                    # Application metrics (would require database connection)
-                    # KNOWLEDGE_ENTRIES.set(get_knowledge_count())
-                    # MARKET_LISTINGS.set(get_market_listings_count())
-                    
-                    logger.debug(
-                        "System metrics updated",
-                        cpu_percent=cpu_percent,
-                        memory_percent=memory_percent
-                    )
-                    
-                    time.sleep(30)  # Update every 30 seconds
-                    
-                except Exception as e:
-                    logger.error("Background monitoring error", error=str(e))
-                    time.sleep(60)  # Wait longer on error
-        
-        thread = threading.Thread(target=monitor_system, daemon=True)
-        thread.start()
-    
     def metrics_endpoint(self):
         """Prometheus metrics endpoint"""
-        return generate_latest(), 200, {'Content-Type': 'text/plain'}
+        if multiprocess_mode_enabled():
+            # Merge the values written by every worker process
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+            for collector in self.scrape_collectors:
+                registry.register(collector)
+        else:
+            registry = REGISTRY
+        return generate_latest(registry), 200, {'Content-Type': CONTENT_TYPE_LATEST}
     
     def get_health_status(self):
         """Get comprehensive health status"""
@@ -299,6 +544,11 @@ class ApplicationMonitor:
         
         return health_data
 
+def mark_worker_dead(pid):
+    """Drop a finished worker's live gauges (call from the server's child_exit hook)"""
+    if multiprocess_mode_enabled():
+        multiprocess.mark_process_dead(pid)
+
 # Monitoring decorators
 def monitor_endpoint(func):
     """Decorator to monitor specific endpoints"""
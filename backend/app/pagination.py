@@ -0,0 +1,105 @@
+"""
+Keyset (cursor) pagination helpers.
+
+Pages are ordered newest first by ``(created_at, _id)``. The cursor handed to
+clients is an opaque, URL-safe encoding of the last item's sort key, so every
+page is a bounded index range scan no matter how deep the client has paged.
+Requests with neither ``limit`` nor ``after`` get the full list, as before
+paging existed, so clients that ignore the cursor header lose nothing.
+Documents without ``created_at`` sort after all dated ones.
+"""
+
+import base64
+import json
+from datetime import datetime
+from bson import ObjectId
+from bson.errors import InvalidId
+from flask import current_app, request
+
+PAGE_SORT = [('created_at', -1), ('_id', -1)]
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+
+class InvalidPageRequest(ValueError):
+    """Raised when ``limit`` or ``after`` cannot be parsed"""
+
+def encode_cursor(doc):
+    """Build an opaque cursor pointing just past ``doc``"""
+    created_at = doc.get('created_at')
+    payload = json.dumps(
+        {
+            't': created_at.isoformat() if isinstance(created_at, datetime) else None,
+            'id': str(doc['_id'])
+        },
+        separators=(',', ':')
+    )
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """Return the ``(created_at, _id)`` sort key stored in a cursor"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        created_at = datetime.fromisoformat(payload['t']) if payload['t'] is not None else None
+        return created_at, ObjectId(payload['id'])
+    except (ValueError, KeyError, TypeError, InvalidId):
+        raise InvalidPageRequest('Invalid cursor')
+
+def get_page_args():
+    """Read ``limit`` and ``after`` from the query string"""
+    return parse_page_args(
+        request.args,
+        current_app.config.get('PAGE_SIZE_DEFAULT', 50),
+        current_app.config.get('PAGE_SIZE_MAX', 200)
+    )
+
+def parse_page_args(args, default_size, max_size):
+    """
+    Parse ``limit`` and ``after`` from a query-string mapping. Returns
+    ``(None, None)`` when neither is given, meaning "no paging".
+    """
+    if 'limit' not in args and 'after' not in args:
+        return None, None
+    try:
+        limit = int(args.get('limit', default_size))
+    except ValueError:
+        raise InvalidPageRequest('limit must be an integer')
+    if limit < 1:
+        raise InvalidPageRequest('limit must be positive')
+
+    after = args.get('after')
+    return min(limit, max_size), decode_cursor(after) if after else None
+
+def fetch_size(limit):
+    """Documents to fetch for a page: one extra to detect a next page"""
+    return limit + 1 if limit else None
+
+def keyset_query(query, after):
+    """Restrict ``query`` to documents that sort after the cursor key"""
+    if not after:
+        return query
+
+    created_at, last_id = after
+    if created_at is None:
+        # Already among the undated documents, which come last
+        after_key = {'created_at': None, '_id': {'$lt': last_id}}
+    else:
+        after_key = {'$or': [
+            {'created_at': {'$lt': created_at}},
+            {'created_at': created_at, '_id': {'$lt': last_id}},
+            {'created_at': None}
+        ]}
+    return {'$and': [query, after_key]}
+
+def split_page(docs, limit):
+    """
+    Split ``limit + 1`` fetched documents into the page and the next cursor.
+    Call this before serializing the documents.
+    """
+    if limit and len(docs) > limit:
+        docs = docs[:limit]
+        return docs, encode_cursor(docs[-1])
+    return docs, None
+
+def page_headers(next_cursor):
+    """Response headers advertising the next page, if there is one"""
+    return {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else {}
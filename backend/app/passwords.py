@@ -0,0 +1,115 @@
+"""
+Password hashing off the request threads.
+
+PBKDF2/scrypt are deliberately slow. Running them inline pins a worker
+thread and holds the GIL for tens of milliseconds per login, so a burst of
+logins starves every other endpoint. ``PasswordHasher`` runs them in a
+small process pool with a bounded number of pending jobs. When the pool
+is saturated it raises ``PasswordHashingBusy`` straight away, and the
+routes answer 503 instead of queueing indefinitely.
+"""
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from werkzeug.security import (
+    DEFAULT_PBKDF2_ITERATIONS, generate_password_hash, check_password_hash
+)
+
+class PasswordHashingBusy(Exception):
+    """Raised when the hashing pool cannot take another job in time"""
+
+def normalize_method(method):
+    """
+    Full parameter string werkzeug records for hashes made with ``method``,
+    e.g. "scrypt" -> "scrypt:32768:8:1", without computing a hash
+    """
+    name, *args = method.split(':')
+    if name == 'scrypt':
+        n, r, p = map(int, args) if args else (2**15, 8, 1)
+        return f"scrypt:{n}:{r}:{p}"
+    if name == 'pbkdf2' and len(args) <= 2:
+        hash_name = args[0] if args else 'sha256'
+        iterations = int(args[1]) if len(args) == 2 else DEFAULT_PBKDF2_ITERATIONS
+        return f"pbkdf2:{hash_name}:{iterations}"
+    raise ValueError(f"Unsupported password hash method '{method}'")
+
+class PasswordHasher:
+    def __init__(self, app=None):
+        self.method = 'scrypt'
+        self.method_prefix = None
+        self.workers = 2
+        self.max_pending = 32
+        self.timeout = 10
+        self._executor = None
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._pid = None
+        self._lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Read the work factor and pool limits from the app config"""
+        self.method = app.config.get('PASSWORD_HASH_METHOD', 'scrypt')
+        self.workers = app.config.get('PASSWORD_HASH_WORKERS', 2)
+        self.max_pending = app.config.get('PASSWORD_HASH_MAX_PENDING', 32)
+        self.timeout = app.config.get('PASSWORD_HASH_TIMEOUT', 10)
+        # Used to spot stored hashes made with an older work factor
+        self.method_prefix = normalize_method(self.method)
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._pid = None
+
+    def _get_executor(self):
+        # The pool's processes belong to the process that started them, so
+        # each pre-forked worker starts its own on first use
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context('spawn')
+                    )
+                    self._pid = pid
+        return self._executor
+
+    def _run(self, func, *args):
+        slots = self._slots
+        if not slots.acquire(blocking=False):
+            raise PasswordHashingBusy('Too many password operations in progress')
+
+        if not self.workers:
+            try:
+                return func(*args)
+            finally:
+                slots.release()
+
+        try:
+            future = self._get_executor().submit(func, *args)
+        except Exception:
+            slots.release()
+            raise
+        # The slot is held until the job really finishes, not until this
+        # request stops waiting for it, so timed-out jobs still count
+        future.add_done_callback(lambda _: slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise PasswordHashingBusy('Password operation timed out')
+
+    def hash(self, password):
+        """Hash a password with the configured method"""
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        """Check a password against a stored hash"""
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """True when a stored hash was made with a different method or work factor"""
+        return password_hash.split('$', 1)[0] != self.method_prefix
+
+password_hasher = PasswordHasher()
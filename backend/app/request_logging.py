@@ -0,0 +1,200 @@
+"""
+Queue-backed, sampled request logging.
+
+The request path only builds a small dict and puts it on a bounded
+in-memory queue. A ``QueueListener`` thread formats the records as JSON
+lines and writes them out. When the queue is full, records are dropped
+and counted, so a slow log sink can never block a request.
+
+Sampling is configured per status class (``REQUEST_LOG_SAMPLE_RATES``)
+and per endpoint (``REQUEST_LOG_ROUTE_SAMPLE_RATES``). Server errors always
+use the status-class rate, so a quiet endpoint still reports its 5xx.
+Sensitive headers are redacted before they are queued.
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from flask import g, request
+
+SENSITIVE_HEADERS = {
+    'authorization',
+    'proxy-authorization',
+    'cookie',
+    'set-cookie',
+    'x-api-key',
+}
+REDACTED = '[redacted]'
+
+def parse_sample_rates(value):
+    """Parse ``"2xx=0.1,5xx=1"`` style settings into a dict"""
+    if isinstance(value, dict):
+        return value
+    rates = {}
+    for item in filter(None, (part.strip() for part in (value or '').split(','))):
+        key, _, rate = item.partition('=')
+        rates[key.strip()] = float(rate)
+    return rates
+
+def redact_headers(headers):
+    return {
+        name: REDACTED if name.lower() in SENSITIVE_HEADERS else value
+        for name, value in headers.items()
+    }
+
+class _DroppingQueueHandler(QueueHandler):
+    """Enqueue records untouched and drop them when the queue is full"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Formatting happens on the listener thread, not the request thread
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+class JSONLineFormatter(logging.Formatter):
+    def format(self, record):
+        if isinstance(record.msg, dict):
+            return json.dumps(record.msg, default=str)
+        return super().format(record)
+
+class RequestLogger:
+    def __init__(self, app=None):
+        self.logger = logging.getLogger('app.requests')
+        self.queue_handler = None
+        self.output_handlers = []
+        self.queue_size = 10000
+        self.listener = None
+        self._listener_pid = None
+        self._listener_lock = threading.Lock()
+        self._stop_registered = False
+        self.status_rates = {}
+        self.route_rates = {}
+        self.log_headers = False
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Register the request hooks if request logging is enabled"""
+        if self._configure(app):
+            app.before_request(self.before_request)
+            app.after_request(self.after_request)
+
+    def init_asgi_app(self, app):
+        """The same hooks for the Quart app (app/asgi.py)"""
+        if not self._configure(app):
+            return
+        from quart import g as async_g, request as async_request
+
+        @app.before_request
+        async def start_async_request_log():
+            async_g.request_log_start = time.perf_counter()
+
+        @app.after_request
+        async def log_async_request(response):
+            self._log(async_request, async_g.pop('request_log_start', None), response)
+            return response
+
+    def _configure(self, app):
+        if not app.config.get('REQUEST_LOG_ENABLED', True):
+            return False
+
+        self.status_rates = parse_sample_rates(app.config.get('REQUEST_LOG_SAMPLE_RATES'))
+        self.route_rates = parse_sample_rates(app.config.get('REQUEST_LOG_ROUTE_SAMPLE_RATES'))
+        self.log_headers = app.config.get('REQUEST_LOG_HEADERS', False)
+
+        self.queue_size = app.config.get('REQUEST_LOG_QUEUE_SIZE', 10000)
+        self.queue_handler = _DroppingQueueHandler(queue.Queue(maxsize=self.queue_size))
+        self.logger.handlers = [self.queue_handler]
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+
+        output = logging.StreamHandler(sys.stdout)
+        output.setFormatter(JSONLineFormatter())
+        self.output_handlers = [output]
+        return True
+
+    @property
+    def dropped(self):
+        return self.queue_handler.dropped if self.queue_handler else 0
+
+    def _ensure_listener(self):
+        # Threads do not survive fork, so each worker starts its own queue
+        # and writer thread on its first request
+        pid = os.getpid()
+        if self._listener_pid == pid:
+            return
+        with self._listener_lock:
+            if self._listener_pid != pid:
+                log_queue = queue.Queue(maxsize=self.queue_size)
+                self.queue_handler.queue = log_queue
+                self.listener = QueueListener(log_queue, *self.output_handlers)
+                self.listener.start()
+                self._listener_pid = pid
+                # Once per process; forked workers inherit the parent's handler
+                if not self._stop_registered:
+                    atexit.register(self.stop)
+                    self._stop_registered = True
+
+    def stop(self):
+        """Flush queued records and stop this process's writer thread"""
+        if self.listener is not None and self._listener_pid == os.getpid():
+            self.listener.stop()
+            self._listener_pid = None
+
+    def _sample_rate(self, endpoint, status_code):
+        status_class = f"{status_code // 100}xx"
+        status_rate = self.status_rates.get(status_class, self.status_rates.get('default', 1.0))
+        if status_code >= 500:
+            return status_rate
+        return self.route_rates.get(endpoint, status_rate)
+
+    def before_request(self):
+        g.request_log_start = time.perf_counter()
+
+    def after_request(self, response):
+        self._log(request, g.pop('request_log_start', None), response)
+        return response
+
+    def _log(self, request, start, response):
+        if start is None:
+            return
+
+        rate = self._sample_rate(request.endpoint, response.status_code)
+        if rate < 1.0 and random.random() >= rate:
+            return
+
+        record = {
+            'ts': time.time(),
+            'method': request.method,
+            'path': request.path,
+            'endpoint': request.endpoint,
+            'status': response.status_code,
+            'duration_ms': round((time.perf_counter() - start) * 1000, 3),
+            'remote_addr': request.remote_addr,
+            'user_agent': request.headers.get('User-Agent', ''),
+        }
+        if self.log_headers:
+            record['headers'] = redact_headers(request.headers)
+        if rate < 1.0:
+            record['sample_rate'] = rate
+
+        self._ensure_listener()
+        self.logger.info(record)
+
+request_logger = RequestLogger()
@@ -10,6 +10,7 @@ def index():
         'endpoints': {
             'auth': '/api/auth',
             'courses': '/api/courses',
-            'market': '/api/market'
+            'market': '/api/market',
+            'sync': '/api/sync'
         }
     }), 200
\ No newline at end of file
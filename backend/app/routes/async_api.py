@@ -0,0 +1,100 @@
+from quart import Blueprint, request, jsonify, current_app
+from app.async_database import get_async_db
+from app.models.course import COURSE_VIEWS, Course, Certificate
+from app.pagination import (
+    InvalidPageRequest, parse_page_args, fetch_size, keyset_query, split_page, page_headers
+)
+from app.certificate_signing import certificate_id_valid
+from app.http_cache import make_etag, cache_headers, not_modified, not_modified_response
+from app.routes.courses import catalog_page_etag
+from app.routes.market import market_feed_pipeline
+
+# Async twins of the public read endpoints in courses.py and market.py.
+# Queries, caches, response shapes and caching headers are shared with the
+# sync views.
+async_api_bp = Blueprint('async_api', __name__)
+
+def get_page_args():
+    return parse_page_args(
+        request.args,
+        current_app.config.get('PAGE_SIZE_DEFAULT', 50),
+        current_app.config.get('PAGE_SIZE_MAX', 200)
+    )
+
+@async_api_bp.route('/market/', methods=['GET'])
+async def get_market_listings():
+    try:
+        available_only = request.args.get('available_only', 'true').lower() == 'true'
+        query = {'is_available': True} if available_only else {}
+        limit, after = get_page_args()
+
+        pipeline = market_feed_pipeline(keyset_query(query, after), limit=fetch_size(limit))
+        cursor = await get_async_db().market_listings.aggregate(pipeline)
+        listings, next_cursor = split_page(await cursor.to_list(), limit)
+
+        return jsonify(listings), 200, page_headers(next_cursor)
+    except InvalidPageRequest as e:
+        return jsonify({'message': str(e)}), 400
+    except Exception as e:
+        current_app.logger.error(f"Error fetching market listings: {str(e)}")
+        return jsonify({'message': 'Error fetching market listings', 'error': str(e)}), 500
+
+@async_api_bp.route('/courses', methods=['GET'])
+async def get_courses():
+    try:
+        view = request.args.get('view', 'outline')
+        if view not in COURSE_VIEWS:
+            return jsonify({"error": f"view must be one of: {', '.join(COURSE_VIEWS)}"}), 400
+
+        filters = {
+            field: request.args[field]
+            for field in ('category', 'level', 'language') if request.args.get(field)
+        }
+        limit, after = get_page_args()
+
+        courses = await Course.get_all_courses_async(filters, limit=fetch_size(limit), after=after, view=view)
+        courses, next_cursor = split_page(courses, limit)
+
+        etag = catalog_page_etag(view, filters, limit, request.args.get('after'), courses, next_cursor)
+        if not_modified(etag, request.if_none_match):
+            return not_modified_response(etag)
+
+        return jsonify(courses), 200, {**page_headers(next_cursor), **cache_headers(etag)}
+    except InvalidPageRequest as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@async_api_bp.route('/courses/<course_id>', methods=['GET'])
+async def get_course(course_id):
+    try:
+        course = await Course.get_course_by_id_async(course_id)
+        if not course:
+            return jsonify({"error": "Course not found"}), 404
+
+        etag = make_etag('course', course['_id'], course.get('updated_at'))
+        if not_modified(etag, request.if_none_match):
+            return not_modified_response(etag)
+
+        return jsonify(course), 200, cache_headers(etag)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@async_api_bp.route('/certificates/<certificate_id>', methods=['GET'])
+async def get_certificate(certificate_id):
+    try:
+        if not certificate_id_valid(certificate_id):
+            return jsonify({"error": "Certificate not found"}), 404
+
+        certificate_data = await Certificate.get_view_async(certificate_id)
+        if not certificate_data:
+            return jsonify({"error": "Certificate not found"}), 404
+
+        etag = make_etag('certificate', certificate_data['certificate_id'], certificate_data['issue_date'])
+        cache_control = f"public, max-age={current_app.config['CERTIFICATE_CACHE_MAX_AGE']}"
+        if not_modified(etag, request.if_none_match):
+            return not_modified_response(etag, cache_control)
+
+        return jsonify(certificate_data), 200, cache_headers(etag, cache_control)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
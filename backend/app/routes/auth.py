@@ -1,8 +1,11 @@
 from flask import Blueprint, request, jsonify, g
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
-from werkzeug.security import generate_password_hash, check_password_hash
-from bson.objectid import ObjectId
 from app.database import get_db
+from app.passwords import password_hasher, PasswordHashingBusy
+from app.models.user import (
+    USER_COLLATION, DUPLICATE_USER_MESSAGES, get_user_profile, invalidate_user_profile
+)
+from pymongo.errors import DuplicateKeyError
 from datetime import datetime
 
 auth_bp = Blueprint('auth', __name__)
@@ -10,17 +13,39 @@ auth_bp = Blueprint('auth', __name__)
 # Helper functions for user operations
 def get_user_by_email(email):
     db = get_db()
-    return db.users.find_one({'email': email})
+    return db.users.find_one({'email': email}, collation=USER_COLLATION)
 
 def get_user_by_username(username):
     db = get_db()
-    return db.users.find_one({'username': username})
+    return db.users.find_one({'username': username}, collation=USER_COLLATION)
 
-def get_user_by_id(user_id):
-    db = get_db()
-    if isinstance(user_id, str):
-        user_id = ObjectId(user_id)
-    return db.users.find_one({'_id': user_id})
+def hashing_busy_response():
+    return jsonify({'message': 'Server is busy, please try again shortly'}), 503, {'Retry-After': '1'}
+
+def upgrade_password_hash(user, password):
+    """Re-hash with the current method after a successful login"""
+    try:
+        new_hash = password_hasher.hash(password)
+    except PasswordHashingBusy:
+        # Not worth failing the login over; try again next time
+        return
+    get_db().users.update_one(
+        {'_id': user['_id']},
+        {'$set': {'password_hash': new_hash}, '$unset': {'password': ''}}
+    )
+    invalidate_user_profile(user['_id'])
+
+def duplicate_user_message(error):
+    """409 message for the unique index a registration collided with"""
+    key_pattern = (error.details or {}).get('keyPattern') or {}
+    for field, message in DUPLICATE_USER_MESSAGES.items():
+        if field in key_pattern:
+            return message
+    # Older servers only name the index in the error message
+    for field, message in DUPLICATE_USER_MESSAGES.items():
+        if f"{field}_" in str(error):
+            return message
+    return 'User already exists'
 
 @auth_bp.route('/register', methods=['POST'])
 def register():
@@ -29,15 +54,12 @@ def register():
     if not data or not data.get('email') or not data.get('password') or not data.get('username'):
         return jsonify({'message': 'Missing required fields'}), 400
     
-    # Check if user already exists
-    if get_user_by_email(data['email']):
-        return jsonify({'message': 'Email already exists'}), 409
-    
-    if get_user_by_username(data['username']):
-        return jsonify({'message': 'Username already exists'}), 409
-    
-    # Create new user
-    hashed_password = generate_password_hash(data['password'])
+    # Create new user; the unique indexes on email and username reject
+    # duplicates, so no lookups are needed first
+    try:
+        hashed_password = password_hasher.hash(data['password'])
+    except PasswordHashingBusy:
+        return hashing_busy_response()
     user = {
         'username': data['username'],
         'email': data['email'],
@@ -48,7 +70,10 @@ def register():
     }
     
     db = get_db()
-    result = db.users.insert_one(user)
+    try:
+        result = db.users.insert_one(user)
+    except DuplicateKeyError as e:
+        return jsonify({'message': duplicate_user_message(e)}), 409
     
     return jsonify({'message': 'User registered successfully', 'user_id': str(result.inserted_id)}), 201
 
@@ -68,10 +93,19 @@ def login():
     else:
         return jsonify({'message': 'Missing username or email'}), 400
     
+    if not user or not data.get('password'):
+        return jsonify({'message': 'Invalid credentials'}), 401
+
     # Verify password
     password_field = 'password_hash' if 'password_hash' in user else 'password'
-    if not user or not check_password_hash(user[password_field], data['password']):
-        return jsonify({'message': 'Invalid credentials'}), 401
+    try:
+        if not password_hasher.verify(user[password_field], data['password']):
+            return jsonify({'message': 'Invalid credentials'}), 401
+    except PasswordHashingBusy:
+        return hashing_busy_response()
+
+    if password_field != 'password_hash' or password_hasher.needs_rehash(user[password_field]):
+        upgrade_password_hash(user, data['password'])
     
     # Create access token
     access_token = create_access_token(identity=str(user['_id']))
@@ -86,7 +120,7 @@ def login():
 @jwt_required()
 def profile():
     current_user_id = get_jwt_identity()
-    user = get_user_by_id(current_user_id)
+    user = get_user_profile(current_user_id)
     
     if not user:
         return jsonify({'message': 'User not found'}), 404
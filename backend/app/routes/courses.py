@@ -1,10 +1,14 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from bson import ObjectId
-from datetime import datetime
-import secrets
-from app.models.course import Course, Enrollment
+from bson.errors import InvalidId
+from app.models.course import Course, Enrollment, Certificate, COURSE_VIEWS
+from app.certificate_signing import (
+    certificate_id_valid, verification_code_valid, is_legacy_certificate_id, codes_match
+)
 from app.database import get_db
+from app.pagination import InvalidPageRequest, get_page_args, fetch_size, split_page, page_headers
+from app.http_cache import make_etag, cache_headers, not_modified, not_modified_response
 
 courses_bp = Blueprint('courses', __name__)
 
@@ -18,12 +22,24 @@ def get_enrollments_collection():
 def get_certificates_collection():
     return get_db().certificates
 
+def catalog_page_etag(view, filters, limit, after, courses, next_cursor):
+    """The page's version is the ids and update times of what is on it"""
+    return make_etag(
+        'courses', view, filters.get('category'), filters.get('level'),
+        filters.get('language'), limit, after,
+        [(course['_id'], course.get('updated_at')) for course in courses], next_cursor
+    )
+
 @courses_bp.route('/courses', methods=['GET'])
 def get_courses():
     try:
         category = request.args.get('category')
         level = request.args.get('level')
         language = request.args.get('language')
+        # The listing only needs metadata; ?view=full includes module bodies
+        view = request.args.get('view', 'outline')
+        if view not in COURSE_VIEWS:
+            return jsonify({"error": f"view must be one of: {', '.join(COURSE_VIEWS)}"}), 400
         
         filters = {}
         if category:
@@ -32,16 +48,19 @@ def get_courses():
             filters['level'] = level
         if language:
             filters['language'] = language
-            
-        courses = Course.get_all_courses(filters)
         
-        # Convert ObjectId to string for JSON serialization
-        for course in courses:
-            course['_id'] = str(course['_id'])
-            if 'instructor_id' in course:
-                course['instructor_id'] = str(course['instructor_id'])
+        limit, after = get_page_args()
+        # Fetch one extra document to learn whether another page exists
+        courses = Course.get_all_courses(filters, limit=fetch_size(limit), after=after, view=view)
+        courses, next_cursor = split_page(courses, limit)
+        
+        etag = catalog_page_etag(view, filters, limit, request.args.get('after'), courses, next_cursor)
+        if not_modified(etag):
+            return not_modified_response(etag)
             
-        return jsonify(courses), 200
+        return jsonify(courses), 200, {**page_headers(next_cursor), **cache_headers(etag)}
+    except InvalidPageRequest as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -51,12 +70,12 @@ def get_course(course_id):
         course = Course.get_course_by_id(course_id)
         if not course:
             return jsonify({"error": "Course not found"}), 404
-            
-        course['_id'] = str(course['_id'])
-        if 'instructor_id' in course:
-            course['instructor_id'] = str(course['instructor_id'])
         
-        return jsonify(course), 200
+        etag = make_etag('course', course['_id'], course.get('updated_at'))
+        if not_modified(etag):
+            return not_modified_response(etag)
+        
+        return jsonify(course), 200, cache_headers(etag)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -66,15 +85,23 @@ def enroll_course(course_id):
     try:
         user_id = get_jwt_identity()
         
-        # Check if already enrolled (you'll need to implement this)
-        # existing_enrollment = Enrollment.check_existing_enrollment(user_id, course_id)
+        course = Course.get_course_by_id(course_id)
+        if not course:
+            return jsonify({"error": "Course not found"}), 404
         
         enrollment_data = {
             "user_id": ObjectId(user_id),
-            "course_id": ObjectId(course_id)
+            "course_id": course['_id']
         }
         
-        enrollment_id = Enrollment.create_enrollment(enrollment_data)
+        # Safe to retry: repeat calls return the existing enrollment
+        enrollment_id, created = Enrollment.create_enrollment(enrollment_data, course)
+        if not created:
+            return jsonify({
+                "message": "Already enrolled in course",
+                "enrollment_id": enrollment_id
+            }), 200
+        
         return jsonify({
             "message": "Successfully enrolled in course",
             "enrollment_id": enrollment_id
@@ -87,25 +114,8 @@ def enroll_course(course_id):
 def get_my_courses():
     try:
         user_id = get_jwt_identity()
-        enrollments = Enrollment.get_user_enrollments(user_id)
-        
-        result = []
-        for enrollment in enrollments:
-            course = Course.get_course_by_id(enrollment['course_id'])
-            if course:
-                enrollment_data = {
-                    "enrollment_id": str(enrollment['_id']),
-                    "course_id": str(course['_id']),
-                    "course_title": course['title'],
-                    "enrolled_at": enrollment['enrolled_at'].isoformat(),
-                    "progress": enrollment['progress'],
-                    "total_modules": len(course['modules']),
-                    "completed": enrollment.get('completed_at') is not None,
-                    "certificate_issued": enrollment.get('certificate_issued', False)
-                }
-                result.append(enrollment_data)
-                
-        return jsonify(result), 200
+        # Documents come back from the aggregation already in response shape
+        return jsonify(Enrollment.get_user_courses(user_id)), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -117,27 +127,81 @@ def update_progress(enrollment_id):
         user_id = get_jwt_identity()
         data = request.get_json()
         
-        enrollment = get_enrollments_collection().find_one({
-            "_id": ObjectId(enrollment_id),
-            "user_id": ObjectId(user_id)
-        })
+        try:
+            module_number = int(data['module_number'])
+        except (TypeError, KeyError, ValueError):
+            module_number = 0
+        if module_number < 1:
+            return jsonify({"error": "module_number must be a positive integer"}), 400
         
-        if not enrollment:
+        # Ownership check and update in one round trip
+        counters = Enrollment.update_progress(
+            enrollment_id, module_number, data.get('quiz_score'), user_id=user_id
+        )
+        
+        if not counters:
             return jsonify({"error": "Enrollment not found"}), 404
-            
-        module_progress = {
-            "module_number": data['module_number'],
-            "completed_at": datetime.utcnow(),
-            "quiz_score": data.get('quiz_score')
-        }
         
-        # Update progress
-        get_enrollments_collection().update_one(
-            {"_id": ObjectId(enrollment_id)},
-            {"$push": {"progress": module_progress}}
-        )
+        return jsonify({
+            "message": "Progress updated",
+            "completed_modules": counters.get('completed_modules', 0),
+            "total_modules": counters.get('total_modules'),
+            "progress_percentage": counters.get('progress_percentage', 0)
+        }), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# Submit many module completions at once (offline clients replaying progress)
+@courses_bp.route('/enrollments/progress/batch', methods=['POST'])
+@jwt_required()
+def update_progress_batch():
+    try:
+        user_id = get_jwt_identity()
+        data = request.get_json()
+        items = data.get('items') if isinstance(data, dict) else None
+        
+        if not isinstance(items, list) or not items:
+            return jsonify({"error": "items must be a non-empty list"}), 400
         
-        return jsonify({"message": "Progress updated"}), 200
+        max_items = current_app.config['PROGRESS_BATCH_MAX_ITEMS']
+        if len(items) > max_items:
+            return jsonify({"error": f"At most {max_items} items per batch"}), 400
+        
+        results = []
+        updates, update_results, seen = [], [], set()
+        for item in items:
+            result = {
+                "enrollment_id": item.get('enrollment_id') if isinstance(item, dict) else None,
+                "module_number": item.get('module_number') if isinstance(item, dict) else None
+            }
+            results.append(result)
+            try:
+                enrollment_id = ObjectId(item['enrollment_id'])
+                module_number = int(item['module_number'])
+            except (TypeError, KeyError, ValueError, InvalidId):
+                module_number = 0
+            if module_number < 1:
+                result['status'] = 'invalid'
+                continue
+            
+            # Replays often repeat a module; apply each one once
+            key = (enrollment_id, module_number)
+            if key in seen:
+                result['status'] = 'duplicate'
+                continue
+            seen.add(key)
+            updates.append((enrollment_id, module_number, item.get('quiz_score')))
+            update_results.append(result)
+        
+        if updates:
+            statuses = Enrollment.update_progress_batch(user_id, updates)
+            for result, status in zip(update_results, statuses):
+                result['status'] = status
+        
+        return jsonify({
+            "results": results,
+            "updated": sum(1 for result in results if result['status'] == 'updated')
+        }), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -156,45 +220,22 @@ def generate_certificate(enrollment_id):
         if not enrollment:
             return jsonify({"error": "Enrollment not found"}), 404
             
-        course = courses_collection.find_one({"_id": enrollment['course_id']})
-        user = users_collection.find_one({"_id": ObjectId(user_id)})
+        counts = Enrollment.module_counts(enrollment)
+        if counts is None:
+            return jsonify({"error": "Course not found"}), 404
         
         # Check if all modules completed
-        if len(enrollment['progress']) < len(course['modules']):
+        completed_modules, total_modules = counts
+        if completed_modules < total_modules:
             return jsonify({"error": "Complete all modules to get certificate"}), 400
             
-        # Generate certificate
-        certificate_id = f"AGRO-{secrets.token_hex(8).upper()}"
-        verification_code = secrets.token_urlsafe(16)
-        
-        certificate = {
-            "enrollment_id": ObjectId(enrollment_id),
-            "user_id": ObjectId(user_id),
-            "course_id": enrollment['course_id'],
-            "certificate_id": certificate_id,
-            "issue_date": datetime.utcnow(),
-            "certificate_url": f"/certificates/{certificate_id}",
-            "verification_code": verification_code
-        }
-        
-        get_certificates_collection().insert_one(certificate)
-        
-        # Update enrollment
-        get_enrollments_collection().update_one(
-            {"_id": ObjectId(enrollment_id)},
-            {
-                "$set": {
-                    "completed_at": datetime.utcnow(),
-                    "certificate_issued": True
-                }
-            }
-        )
+        certificate, created = Certificate.issue(enrollment)
         
         return jsonify({
-            "message": "Certificate generated",
-            "certificate_id": certificate_id,
-            "certificate_url": f"/certificates/{certificate_id}"
-        }), 201
+            "message": "Certificate generated" if created else "Certificate already exists",
+            "certificate_id": certificate['certificate_id'],
+            "certificate_url": certificate['certificate_url']
+        }), 201 if created else 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -202,39 +243,21 @@ def generate_certificate(enrollment_id):
 @courses_bp.route('/certificates/<certificate_id>', methods=['GET'])
 def get_certificate(certificate_id):
     try:
-        certificates_collection = get_certificates_collection()
-        certificate = certificates_collection.find_one({"certificate_id": certificate_id})
-        
-        if not certificate:
+        # Forged or mistyped ids are rejected without a database read
+        if not certificate_id_valid(certificate_id):
             return jsonify({"error": "Certificate not found"}), 404
         
-        # Get course and user details
-        course = get_courses_collection().find_one({"_id": certificate['course_id']})
-        enrollment = get_enrollments_collection().find_one({"_id": certificate['enrollment_id']})
-        
-        # Get user details from users collection
-        users_collection = get_db().users
-        user = users_collection.find_one({"_id": certificate['user_id']})
+        certificate_data = Certificate.get_view(certificate_id)
+        if not certificate_data:
+            return jsonify({"error": "Certificate not found"}), 404
         
-        if not course or not user:
-            return jsonify({"error": "Certificate data incomplete"}), 404
+        # Issued certificates do not change
+        etag = make_etag('certificate', certificate_data['certificate_id'], certificate_data['issue_date'])
+        cache_control = f"public, max-age={current_app.config['CERTIFICATE_CACHE_MAX_AGE']}"
+        if not_modified(etag):
+            return not_modified_response(etag, cache_control)
         
-        certificate_data = {
-            "certificate_id": certificate['certificate_id'],
-            "course_title": course['title'],
-            "course_category": course['category'],
-            "course_level": course['level'],
-            "course_duration": course['duration_hours'],
-            "student_name": f"{user.get('first_name', '')} {user.get('last_name', '')}".strip(),
-            "student_email": user.get('email', ''),
-            "issue_date": certificate['issue_date'].isoformat(),
-            "completion_date": enrollment.get('completed_at', certificate['issue_date']).isoformat(),
-            "verification_code": certificate['verification_code'],
-            "modules_completed": len(enrollment.get('progress', [])),
-            "total_modules": len(course.get('modules', []))
-        }
-        
-        return jsonify(certificate_data), 200
+        return jsonify(certificate_data), 200, cache_headers(etag, cache_control)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -257,7 +280,7 @@ def get_my_certificates():
                     "course_title": course['title'],
                     "course_category": course['category'],
                     "course_level": course['level'],
-                    "issue_date": cert['issue_date'].isoformat(),
+                    "issue_date": cert['issue_date'],
                     "certificate_url": f"/api/certificates/{cert['certificate_id']}"
                 }
                 result.append(cert_data)
@@ -270,32 +293,34 @@ def get_my_certificates():
 @courses_bp.route('/certificates/<certificate_id>/verify', methods=['POST'])
 def verify_certificate(certificate_id):
     try:
-        data = request.get_json()
-        verification_code = data.get('verification_code')
+        data = request.get_json(silent=True)
+        verification_code = data.get('verification_code') if isinstance(data, dict) else None
         
         if not verification_code:
             return jsonify({"error": "Verification code required"}), 400
         
-        certificates_collection = get_certificates_collection()
-        certificate = certificates_collection.find_one({
-            "certificate_id": certificate_id,
-            "verification_code": verification_code
-        })
+        invalid = {"valid": False, "message": "Invalid certificate or verification code"}
+        
+        # Signed ids and codes are checked in memory first
+        if not verification_code_valid(certificate_id, verification_code):
+            return jsonify(invalid), 200
         
+        certificate = Certificate.get_view(certificate_id)
         if not certificate:
-            return jsonify({"valid": False, "message": "Invalid certificate or verification code"}), 200
+            return jsonify(invalid), 200
         
-        # Get additional details
-        course = get_courses_collection().find_one({"_id": certificate['course_id']})
-        users_collection = get_db().users
-        user = users_collection.find_one({"_id": certificate['user_id']})
+        # Codes of legacy ids are random and can only be checked against the store
+        if is_legacy_certificate_id(certificate_id) and not codes_match(
+            certificate['verification_code'], verification_code
+        ):
+            return jsonify(invalid), 200
         
         return jsonify({
             "valid": True,
             "certificate_id": certificate['certificate_id'],
-            "student_name": f"{user.get('first_name', '')} {user.get('last_name', '')}".strip(),
-            "course_title": course['title'],
-            "issue_date": certificate['issue_date'].isoformat(),
+            "student_name": certificate['student_name'],
+            "course_title": certificate['course_title'],
+            "issue_date": certificate['issue_date'],
             "issuer": "Agro Youth Platform"
         }), 200
     except Exception as e:
@@ -321,62 +346,33 @@ def complete_course(enrollment_id):
         if enrollment.get('completed_at'):
             return jsonify({"message": "Course already completed"}), 200
         
-        # Get course to check modules
-        course = get_courses_collection().find_one({"_id": enrollment['course_id']})
-        if not course:
+        counts = Enrollment.module_counts(enrollment)
+        if counts is None:
             return jsonify({"error": "Course not found"}), 404
         
         # Check if all modules completed
-        if len(enrollment.get('progress', [])) < len(course.get('modules', [])):
+        completed_modules, total_modules = counts
+        if completed_modules < total_modules:
             return jsonify({
                 "error": "Complete all modules first",
-                "completed_modules": len(enrollment.get('progress', [])),
-                "total_modules": len(course.get('modules', []))
+                "completed_modules": completed_modules,
+                "total_modules": total_modules
             }), 400
         
-        # Check if certificate already exists
-        existing_cert = get_certificates_collection().find_one({
-            "enrollment_id": ObjectId(enrollment_id)
-        })
+        # Returns the existing certificate if one was already issued
+        certificate, created = Certificate.issue(enrollment)
         
-        if existing_cert:
+        if not created:
             return jsonify({
                 "message": "Certificate already exists",
-                "certificate_id": existing_cert['certificate_id'],
-                "certificate_url": f"/api/certificates/{existing_cert['certificate_id']}"
+                "certificate_id": certificate['certificate_id'],
+                "certificate_url": certificate['certificate_url']
             }), 200
         
-        # Generate certificate
-        certificate_id = f"AGRO-{secrets.token_hex(8).upper()}"
-        verification_code = secrets.token_urlsafe(16)
-        
-        certificate = {
-            "enrollment_id": ObjectId(enrollment_id),
-            "user_id": ObjectId(user_id),
-            "course_id": enrollment['course_id'],
-            "certificate_id": certificate_id,
-            "issue_date": datetime.utcnow(),
-            "certificate_url": f"/api/certificates/{certificate_id}",
-            "verification_code": verification_code
-        }
-        
-        get_certificates_collection().insert_one(certificate)
-        
-        # Update enrollment
-        get_enrollments_collection().update_one(
-            {"_id": ObjectId(enrollment_id)},
-            {
-                "$set": {
-                    "completed_at": datetime.utcnow(),
-                    "certificate_issued": True
-                }
-            }
-        )
-        
         return jsonify({
             "message": "Course completed and certificate generated",
-            "certificate_id": certificate_id,
-            "certificate_url": f"/api/certificates/{certificate_id}"
+            "certificate_id": certificate['certificate_id'],
+            "certificate_url": certificate['certificate_url']
         }), 201
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -396,31 +392,32 @@ def get_enrollment_status(enrollment_id):
         if not enrollment:
             return jsonify({"error": "Enrollment not found"}), 404
         
-        course = get_courses_collection().find_one({"_id": enrollment['course_id']})
-        if not course:
+        # Counters and the course title are stored on the enrollment
+        if Enrollment.module_counts(enrollment) is None:
             return jsonify({"error": "Course not found"}), 404
         
-        # Check for certificate
-        certificate = get_certificates_collection().find_one({
-            "enrollment_id": ObjectId(enrollment_id)
-        })
-        
-        progress_percentage = (len(enrollment.get('progress', [])) / len(course.get('modules', []))) * 100 if course.get('modules') else 0
+        certificate_id = enrollment.get('certificate_id')
+        if enrollment.get('certificate_issued') and not certificate_id:
+            # Issued before enrollments recorded the certificate id
+            certificate = get_certificates_collection().find_one(
+                {"enrollment_id": enrollment['_id']}, {"certificate_id": 1}
+            )
+            certificate_id = certificate['certificate_id'] if certificate else None
         
         status_data = {
             "enrollment_id": enrollment_id,
-            "course_id": str(enrollment['course_id']),
-            "course_title": course['title'],
-            "enrolled_at": enrollment['enrolled_at'].isoformat(),
+            "course_id": enrollment['course_id'],
+            "course_title": enrollment['course_title'],
+            "enrolled_at": enrollment['enrolled_at'],
             "progress": enrollment.get('progress', []),
-            "completed_modules": len(enrollment.get('progress', [])),
-            "total_modules": len(course.get('modules', [])),
-            "progress_percentage": round(progress_percentage, 2),
-            "completed_at": enrollment.get('completed_at').isoformat() if enrollment.get('completed_at') else None,
+            "completed_modules": enrollment['completed_modules'],
+            "total_modules": enrollment['total_modules'],
+            "progress_percentage": enrollment['progress_percentage'],
+            "completed_at": enrollment.get('completed_at'),
             "is_completed": bool(enrollment.get('completed_at')),
             "certificate_issued": bool(enrollment.get('certificate_issued')),
-            "certificate_id": certificate['certificate_id'] if certificate else None,
-            "certificate_url": f"/api/certificates/{certificate['certificate_id']}" if certificate else None
+            "certificate_id": certificate_id,
+            "certificate_url": f"/api/certificates/{certificate_id}" if certificate_id else None
         }
         
         return jsonify(status_data), 200
@@ -1,11 +1,42 @@
 from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app.database import get_db
+from app.models.user import get_user_profile
 from bson.objectid import ObjectId
 from datetime import datetime
+from app.pagination import (
+    PAGE_SORT, InvalidPageRequest, get_page_args, fetch_size, keyset_query, split_page, page_headers
+)
 
 market_bp = Blueprint('market', __name__)
 
+def market_feed_pipeline(query, limit=None, sort=PAGE_SORT):
+    """Aggregation that returns listings already joined with the farmer's username"""
+    pipeline = [
+        {'$match': query},
+        {'$sort': dict(sort)},
+    ]
+    if limit:
+        # Limit before the join so only the returned page is looked up
+        pipeline.append({'$limit': limit})
+    return pipeline + [
+        {'$lookup': {
+            'from': 'users',
+            'let': {'farmer_id': '$farmer_id'},
+            'pipeline': [
+                {'$match': {'$expr': {'$eq': ['$_id', '$$farmer_id']}}},
+                {'$project': {'_id': 0, 'username': 1}}
+            ],
+            'as': 'farmer'
+        }},
+        {'$addFields': {
+            'farmer_username': {
+                '$ifNull': [{'$arrayElemAt': ['$farmer.username', 0]}, 'Unknown']
+            }
+        }},
+        {'$project': {'farmer': 0}}
+    ]
+
 @market_bp.route('/', methods=['GET'])
 def get_market_listings():
     try:
@@ -13,26 +44,17 @@ def get_market_listings():
         
         db = get_db()
         query = {'is_available': True} if available_only else {}
-        listings = list(db.market_listings.find(query))
+        limit, after = get_page_args()
         
-        # Convert ObjectId to string for JSON serialization
-        for listing in listings:
-            listing['_id'] = str(listing['_id'])
-            if 'farmer_id' in listing and listing['farmer_id']:
-                listing['farmer_id'] = str(listing['farmer_id'])
-            
-            # Format dates for JSON serialization
-            if 'created_at' in listing:
-                listing['created_at'] = listing['created_at'].isoformat()
-            if 'updated_at' in listing:
-                listing['updated_at'] = listing['updated_at'].isoformat()
-                
-            # Add farmer username if possible
-            if 'farmer_id' in listing and listing['farmer_id']:
-                farmer = db.users.find_one({'_id': ObjectId(listing['farmer_id'])})
-                listing['farmer_username'] = farmer['username'] if farmer else 'Unknown'
+        # Listings and farmer usernames come back in a single round trip;
+        # one extra listing tells us whether there is a next page
+        pipeline = market_feed_pipeline(keyset_query(query, after), limit=fetch_size(limit))
+        listings = list(db.market_listings.aggregate(pipeline))
+        listings, next_cursor = split_page(listings, limit)
         
-        return jsonify(listings), 200
+        return jsonify(listings), 200, page_headers(next_cursor)
+    except InvalidPageRequest as e:
+        return jsonify({'message': str(e)}), 400
     except Exception as e:
         current_app.logger.error(f"Error fetching market listings: {str(e)}")
         return jsonify({'message': 'Error fetching market listings', 'error': str(e)}), 500
@@ -62,22 +84,12 @@ def create_market_listing():
         }
         
         db = get_db()
-        result = db.market_listings.insert_one(new_listing)
-        
-        # Get the newly created listing
-        listing = db.market_listings.find_one({'_id': result.inserted_id})
-        
-        # Prepare response
-        listing['_id'] = str(listing['_id'])
-        if 'farmer_id' in listing and listing['farmer_id']:
-            listing['farmer_id'] = str(listing['farmer_id'])
-        if 'created_at' in listing:
-            listing['created_at'] = listing['created_at'].isoformat()
-        if 'updated_at' in listing:
-            listing['updated_at'] = listing['updated_at'].isoformat()
+        # insert_one fills in new_listing['_id']; no need to read it back
+        db.market_listings.insert_one(new_listing)
+        listing = new_listing
         
         # Add farmer username
-        farmer = db.users.find_one({'_id': ObjectId(user_id)}) if user_id else None
+        farmer = get_user_profile(user_id) if user_id else None
         listing['farmer_username'] = farmer['username'] if farmer else 'Unknown'
         
         return jsonify(listing), 201
@@ -0,0 +1,173 @@
+import base64
+import json
+from flask import Blueprint, request, jsonify, current_app
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from bson import ObjectId
+from bson.errors import InvalidId
+from datetime import datetime, timedelta, timezone
+from app.database import get_db
+from app.models.course import COURSE_OUTLINE_PROJECTION
+from app.models.sync import SYNC_SORT, TOMBSTONE_RETENTION, deleted_since, resume_query
+from app.routes.market import market_feed_pipeline
+
+sync_bp = Blueprint('sync', __name__)
+
+CERTIFICATE_SYNC_PROJECTION = {
+    "enrollment_id": 1,
+    "course_id": 1,
+    "certificate_id": 1,
+    "issue_date": 1,
+    "certificate_url": 1,
+    "updated_at": 1
+}
+
+def parse_watermark(value):
+    """Naive UTC datetime from an ISO-8601 watermark"""
+    watermark = datetime.fromisoformat(value)
+    if watermark.tzinfo is not None:
+        watermark = watermark.astimezone(timezone.utc).replace(tzinfo=None)
+    return watermark
+
+def _isoformat(value):
+    return value.isoformat() if isinstance(value, datetime) else None
+
+def _parse_optional(value):
+    return datetime.fromisoformat(value) if value is not None else None
+
+def encode_sync_cursor(since, watermark, positions):
+    """
+    Opaque cursor for the next call of a truncated sync: the original
+    ``since``, the watermark to hand out once done, and the last
+    ``(updated_at, _id)`` returned for each section that still has more
+    """
+    payload = json.dumps({
+        's': _isoformat(since),
+        'w': watermark.isoformat(),
+        'p': {name: [_isoformat(updated_at), str(doc_id)] for name, (updated_at, doc_id) in positions.items()}
+    }, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+def decode_sync_cursor(cursor):
+    """Return ``(since, watermark, positions)`` from a sync cursor"""
+    padded = cursor + '=' * (-len(cursor) % 4)
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        positions = {
+            name: (_parse_optional(updated_at), ObjectId(doc_id))
+            for name, (updated_at, doc_id) in payload['p'].items()
+        }
+        return _parse_optional(payload['s']), datetime.fromisoformat(payload['w']), positions
+    except (ValueError, KeyError, TypeError, AttributeError, InvalidId):
+        raise ValueError('Invalid sync cursor')
+
+def changed_documents(cursor, limit):
+    """Split a limit + 1 result into the page and whether more remain"""
+    docs = list(cursor)
+    return docs[:limit], len(docs) > limit
+
+# Everything created, updated or deleted since a watermark
+@sync_bp.route('/sync', methods=['GET'])
+@jwt_required(optional=True)
+def sync():
+    try:
+        user_id = get_jwt_identity()
+        db = get_db()
+        limit = current_app.config['SYNC_MAX_ITEMS']
+        now = datetime.utcnow()
+        reset = False
+
+        if request.args.get('cursor'):
+            # Continuing a truncated sync: only the unfinished sections, each
+            # from where the previous call stopped. Deletions were already sent.
+            try:
+                since, watermark, positions = decode_sync_cursor(request.args['cursor'])
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            tombstones = {}
+        else:
+            since = None
+            if request.args.get('since'):
+                try:
+                    since = parse_watermark(request.args['since'])
+                except ValueError:
+                    return jsonify({"error": "since must be an ISO-8601 timestamp"}), 400
+
+            # Deletions older than the tombstone retention are gone; start over
+            reset = since is not None and since < now - TOMBSTONE_RETENTION
+            if reset:
+                since = None
+
+            # Changes can commit slightly out of timestamp order across workers,
+            # so the next sync starts a little before now and may repeat a few
+            # documents. Clients apply updates by _id, so repeats are harmless.
+            watermark = now - timedelta(seconds=current_app.config['SYNC_CLOCK_SKEW_SECONDS'])
+            positions = None
+            tombstones = deleted_since(since, ObjectId(user_id) if user_id else None) if since else {}
+
+        def wanted(name):
+            return positions is None or name in positions
+
+        def changed(name, query=None):
+            query = {**(query or {}), 'updated_at': {'$gte': since}} if since else (query or {})
+            return resume_query(query, positions.get(name) if positions else None)
+
+        sections = {}
+        if wanted('courses'):
+            courses, more_courses = changed_documents(
+                db.courses.find(changed('courses'), COURSE_OUTLINE_PROJECTION).sort(SYNC_SORT).limit(limit + 1), limit
+            )
+            sections['courses'] = (courses, more_courses, 'is_published')
+
+        if wanted('market_listings'):
+            listings, more_listings = changed_documents(
+                db.market_listings.aggregate(
+                    market_feed_pipeline(changed('market_listings'), limit=limit + 1, sort=SYNC_SORT)
+                ), limit
+            )
+            sections['market_listings'] = (listings, more_listings, 'is_available')
+
+        if user_id:
+            owner = {'user_id': ObjectId(user_id)}
+            if wanted('enrollments'):
+                enrollments, more_enrollments = changed_documents(
+                    db.enrollments.find(changed('enrollments', owner)).sort(SYNC_SORT).limit(limit + 1), limit
+                )
+                sections['enrollments'] = (enrollments, more_enrollments, None)
+
+            if wanted('certificates'):
+                certificates, more_certificates = changed_documents(
+                    db.certificates.find(
+                        changed('certificates', owner), CERTIFICATE_SYNC_PROJECTION
+                    ).sort(SYNC_SORT).limit(limit + 1), limit
+                )
+                sections['certificates'] = (certificates, more_certificates, None)
+
+        next_positions = {}
+        result = {}
+        for name, (docs, more, live_field) in sections.items():
+            updated, deleted = [], list(tombstones.get(name, []))
+            for doc in docs:
+                # Unpublished courses and unavailable listings leave the feed
+                if live_field and not doc.get(live_field, True):
+                    deleted.append(doc['_id'])
+                else:
+                    updated.append(doc)
+            if not since:
+                deleted = []
+            if more:
+                # Resume after the last returned change of a truncated section
+                next_positions[name] = (docs[-1].get('updated_at'), docs[-1]['_id'])
+            result[name] = {"updated": updated, "deleted": deleted}
+
+        # The watermark is only handed out once every section has caught up;
+        # until then the client follows the cursor
+        has_more = bool(next_positions)
+        return jsonify({
+            **result,
+            "watermark": None if has_more else watermark.isoformat(),
+            "cursor": encode_sync_cursor(since, watermark, next_positions) if has_more else None,
+            "has_more": has_more,
+            "reset": reset
+        }), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
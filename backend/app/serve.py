@@ -0,0 +1,120 @@
+"""
+Production server, started with ``python serve.py`` from backend/
+
+Runs the app under gunicorn's pre-forking server. The Flask app is built
+once in the master process (preload) and shared copy-on-write with the
+workers. Each worker then rebuilds its MongoDB pool and warms the catalog
+cache in ``post_fork`` before it accepts requests.
+
+Settings come from the environment:
+
+    WEB_WORKER_CLASS          sync | gthread | gevent      (default gthread)
+    WEB_CONCURRENCY           worker processes             (default 2 x CPUs + 1)
+    WEB_THREADS               threads per gthread worker   (default 4)
+    WEB_WORKER_CONNECTIONS    greenlets per gevent worker  (default 1000)
+    WEB_MAX_REQUESTS          recycle a worker after N requests (default 5000, 0 = never)
+    WEB_MAX_REQUESTS_JITTER   random spread for recycling  (default 500)
+    WEB_TIMEOUT               hung-worker timeout, seconds (default 30)
+    WEB_GRACEFUL_TIMEOUT      drain time on restart, seconds (default 30)
+    WEB_KEEPALIVE             keep-alive, seconds          (default 5)
+    HOST / PORT               bind address                 (default 0.0.0.0:5000)
+    APP_CONFIG                config class name            (default production)
+    PROMETHEUS_MULTIPROC_DIR  shared metrics directory, emptied at start
+                              (default a new temp directory)
+
+Send SIGHUP to the master for a graceful restart (new workers start before
+old ones are drained) and SIGTERM for a graceful shutdown.
+"""
+
+import multiprocessing
+import os
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+def server_options():
+    """gunicorn settings for the configured serving mode"""
+    worker_class = os.environ.get('WEB_WORKER_CLASS', 'gthread')
+    options = {
+        'bind': f"{os.environ.get('HOST', '0.0.0.0')}:{os.environ.get('PORT', 5000)}",
+        'workers': _env_int('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1),
+        'worker_class': worker_class,
+        'preload_app': True,
+        'max_requests': _env_int('WEB_MAX_REQUESTS', 5000),
+        'max_requests_jitter': _env_int('WEB_MAX_REQUESTS_JITTER', 500),
+        'timeout': _env_int('WEB_TIMEOUT', 30),
+        'graceful_timeout': _env_int('WEB_GRACEFUL_TIMEOUT', 30),
+        'keepalive': _env_int('WEB_KEEPALIVE', 5),
+        'post_fork': post_fork,
+        'worker_exit': worker_exit,
+        'child_exit': child_exit,
+    }
+    if worker_class == 'gthread':
+        options['threads'] = _env_int('WEB_THREADS', 4)
+    elif worker_class == 'gevent':
+        options['worker_connections'] = _env_int('WEB_WORKER_CONNECTIONS', 1000)
+    return options
+
+def post_fork(server, worker):
+    """Give the new worker its own MongoDB pool and a warm catalog cache"""
+    from pymongo.errors import PyMongoError
+    from app import database
+    from app.models.course import Course
+
+    database.reset_client()
+    try:
+        database.warm_up()
+        # The default (unpaged) catalog listing is the hottest read
+        Course.get_all_courses({}, view='outline')
+    except PyMongoError as e:
+        server.log.warning(f"Worker {worker.pid} warm-up failed: {str(e)}")
+
+def worker_exit(server, worker):
+    """Ship the exiting worker's last aggregated CloudWatch interval"""
+    from app.monitoring import monitor
+    monitor.metrics.stop()
+
+def child_exit(server, worker):
+    """Clean up a finished worker's multiprocess metrics"""
+    try:
+        from app.monitoring import mark_worker_dead
+    except ImportError:
+        return
+    mark_worker_dead(worker.pid)
+
+def main():
+    options = server_options()
+    if options['worker_class'] == 'gevent':
+        # Importing this module already imported the app package, so the
+        # patch must come from the launcher (backend/serve.py)
+        from gevent import monkey
+        if not monkey.is_module_patched('socket'):
+            raise SystemExit('gevent workers must be started with `python serve.py`')
+
+    if not os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        # Without it each worker would export only its own metrics
+        raise SystemExit('start the server with `python serve.py`')
+
+    from gunicorn.app.base import BaseApplication
+    from app import create_app, certificate_signing
+    from app.config import server_config_name
+
+    class ProductionServer(BaseApplication):
+        def __init__(self, application, options):
+            self.application = application
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return self.application
+
+    application = create_app(server_config_name())
+    certificate_signing.require_server_key(application)
+    ProductionServer(application, options).run()
+
+if __name__ == '__main__':
+    main()
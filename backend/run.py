@@ -1,10 +1,14 @@
 import os
-from app import create_app
-
-config_name = os.getenv('FLASK_ENV', 'development')
-app = create_app(config_name)
 
+# Development server only; use `python serve.py` in production.
+# App creation stays under the __main__ guard: the password hashing pool
+# starts its processes with "spawn", which re-imports this script in each.
 if __name__ == '__main__':
+    from app import create_app
+
+    config_name = os.getenv('FLASK_ENV', 'development')
+    app = create_app(config_name)
+
     PORT = int(os.getenv('PORT', 80))
-    app.run(host='0.0.0.0', port=PORT, debug=True)
-    print(f"Server is running on port {PORT}")
\ No newline at end of file
+    app.run(host='0.0.0.0', port=PORT, debug=app.config.get('DEBUG', False))
+    print(f"Server is running on port {PORT}")
@@ -0,0 +1,38 @@
+"""
+Production launcher: ``python serve.py``
+
+Kept outside the ``app`` package so that, before the app, pymongo, ssl,
+threading or prometheus_client are imported:
+
+- gevent can monkey-patch the standard library;
+- the Prometheus multiprocess directory exists and holds no files from an
+  earlier run. prometheus_client reads PROMETHEUS_MULTIPROC_DIR at import,
+  and every forked worker writes its metrics there.
+
+Server settings are documented in app/serve.py.
+"""
+
+import glob
+import os
+import tempfile
+
+def prepare_metrics_dir():
+    """Create or empty PROMETHEUS_MULTIPROC_DIR (a fresh temp dir by default)"""
+    path = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if not path:
+        os.environ['PROMETHEUS_MULTIPROC_DIR'] = tempfile.mkdtemp(prefix='dagri-talk-metrics-')
+        return
+    os.makedirs(path, exist_ok=True)
+    # Counters left by a previous run would be merged into this one's
+    for stale in glob.glob(os.path.join(path, '*.db')):
+        os.remove(stale)
+
+if __name__ == '__main__':
+    if os.environ.get('WEB_WORKER_CLASS') == 'gevent':
+        from gevent import monkey
+        monkey.patch_all()
+
+    prepare_metrics_dir()
+
+    from app.serve import main
+    main()
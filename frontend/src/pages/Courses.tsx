@@ -10,11 +10,7 @@ interface Course {
   level: string;
   duration_hours: number;
   language: string;
-  modules: Array<{
-    module_number: number;
-    title: string;
-    duration_minutes: number;
-  }>;
+  module_count: number;
 }
 
 const Courses: React.FC = () => {
@@ -268,7 +264,7 @@ const Courses: React.FC = () => {
                       <svg className="w-4 h-4" fill="currentColor" viewBox="0 0 20 20">
                         <path d="M9 12l2 2 4-4m6 2a9 9 0 11-18 0 9 9 0 0118 0z" />
                       </svg>
-                      <span>{course.modules.length} modules</span>
+                      <span>{course.module_count} modules</span>
                     </div>
                     <div className="flex items-center space-x-1">
                       <svg className="w-4 h-4" fill="currentColor" viewBox="0 0 20 20">